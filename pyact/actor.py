@@ -21,7 +21,9 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import itertools
 import sys
+import time
 import traceback
 import urlparse
 import uuid
@@ -29,13 +31,9 @@ import weakref
 import base64
 
 
-try:
-    import simplejson as json
-except ImportError:
-    import json
-
 from gevent import event
 import gevent
+import gevent.pool
 
 #import eventlet
 #from eventlet import hubs
@@ -44,14 +42,41 @@ import gevent
 
 #from eventlet.green import httplib
 
+from pyact import codec
 from pyact import exc
+from pyact import mailbox
 from pyact import shape
+from pyact import timer
 
 
 ## If set to true, an Actor will print out every exception, even if the parent
 ## handles the exception properly.
 NOISY_ACTORS = False
 
+## Actor and call ids are a prefix which is unique to this process
+## followed by a counter, which is a lot cheaper than a uuid per id.
+_id_prefix = uuid.uuid4().hex[:16]
+_id_counter = itertools.count(1)
+
+## Whether Actors keep the counters reported by Actor.metrics. Turn
+## off to shave a little off every cast and receive.
+METRICS = True
+
+## The tracer installed with set_tracer, or None.
+_tracer = None
+
+## The callback Actor whose handler is running, if any. Set by
+## pyact.callback.
+_handling = None
+
+## Set by pyact.node to a function which returns an Address given a
+## node name and an actor id. See remote_address.
+_remote_address_factory = None
+
+## Functions which are called with the Actor as their only argument
+## whenever an Actor exits. See add_exit_hook.
+_exit_hooks = []
+
 
 class ActorError(RuntimeError):
     """Base class for actor exceptions.
@@ -87,6 +112,135 @@ class InvalidCallMessage(ActorError):
     """
     pass
 
+class MailboxFull(ActorError):
+    """Exception which is raised to the sender of a message when the
+    mailbox of the receiving Actor is full, and the Actor's
+    mailbox_policy is 'error'.
+    """
+    pass
+
+class ServerBusy(ActorError):
+    """Sent back as the exception of a call which a Server rejected
+    because it was already handling as many calls as it may.
+    """
+    pass
+
+class _Hibernate(BaseException):
+    """Raised by Actor.hibernate to unwind the stack of the Actor.
+    Not an Exception, so that except Exception clauses let it pass.
+    """
+    def __init__(self, continuation, args, kw):
+        BaseException.__init__(self)
+        self.continuation = continuation
+        self.args = args
+        self.kw = kw
+
+
+def _unwound_bytes(tb):
+    """Return the size of the frames in the traceback tb, leaving out
+    the frame which caught the exception. The objects the frames
+    refer to are not counted.
+    """
+    nbytes = 0
+    tb = tb.tb_next
+    while tb is not None:
+        nbytes += sys.getsizeof(tb.tb_frame)
+        tb = tb.tb_next
+    return nbytes
+
+
+def unique_id():
+    """Return a new id, unique to this process and across processes.
+    """
+    return '%s-%x' % (_id_prefix, _id_counter.next())
+
+
+def add_exit_hook(hook):
+    """Call hook with the Actor as argument whenever an Actor exits,
+    after its links have been notified.
+    """
+    _exit_hooks.append(hook)
+
+
+def set_tracer(tracer):
+    """Install tracer, which is then called for every traced event
+    as tracer(kind, timestamp, actor_id, peer_id, value), where kind is
+    one of:
+
+     * 'spawn': actor_id was spawned by peer_id. value is 1 if they
+       are linked, 0 if not.
+     * 'send': actor_id cast a message to peer_id.
+     * 'deliver': a message from peer_id was put in the mailbox of
+       actor_id. value is the sequence number of the message in that
+       mailbox, counting from 1, or 0 for a call response, which
+       goes straight to the reply slot of its call.
+     * 'drop': a message from peer_id to actor_id was not delivered
+       because the mailbox of actor_id was full. See mailbox_policy.
+     * 'match': actor_id took the message with sequence number value
+       out of its mailbox; 0 if the number is not known.
+     * 'timeout': a receive of actor_id timed out.
+     * 'exit': actor_id exited; value is 1 if it raised an exception.
+
+    peer_id is None when the peer is not an Actor. Pass None to
+    remove the tracer. Return the tracer that was installed before.
+    See pyact.trace for a tracer that writes a trace file.
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer
+    return previous
+
+
+def _current_actor():
+    """Return the Actor the current greenlet runs for. The greenlets
+    of a concurrent Server's calls run for the Server.
+    """
+    current = gevent.getcurrent()
+    if type(current) is _CallHandler:
+        return current.server
+    return current
+
+
+def curaddr():
+    """Return the Address of the current Actor.
+    """
+    if _handling is not None:
+        return _handling.address
+    return _current_actor().address
+
+
+def hibernate(continuation, *args, **kw):
+    """Hibernate the current Actor. See Actor.hibernate.
+    """
+    gevent.getcurrent().hibernate(continuation, *args, **kw)
+
+
+def _current_id():
+    if _handling is not None:
+        return _handling.actor_id
+    return getattr(_current_actor(), 'actor_id', None)
+
+
+def _exited(actor, result, formatted=None):
+    """Tell links, the tracer and the exit hooks that actor exited,
+    and forget about it. formatted is the formatted exception if the
+    actor raised one.
+    """
+    try:
+        if formatted is not None:
+            for link in actor._alinks:
+                link.cast({'address': actor.address, 'exception': formatted})
+        for link in actor._exit_links:
+            link.cast({'address': actor.address, 'exit': result})
+    finally:
+        if _tracer is not None:
+            _tracer('exit', time.time(), actor.actor_id, None,
+                    int(formatted is not None))
+        Actor.all_actors.pop(actor.actor_id)
+        for hook in _exit_hooks:
+            hook(actor)
+
+
 def is_actor_type(obj):
     """Return True if obj is a subclass of Actor, False if not.
     """
@@ -96,6 +250,27 @@ def is_actor_type(obj):
         return False
 
 
+def _instantiate(spawnable, args, kw):
+    if is_actor_type(spawnable):
+        spawnable = spawnable()
+    else:
+        spawnable = Actor(spawnable)
+    if 'mailbox_size' in kw:
+        spawnable._mailbox_size = kw.pop('mailbox_size')
+    if 'mailbox_policy' in kw:
+        spawnable._mailbox_policy = kw.pop('mailbox_policy')
+    spawnable._args = (args, kw)
+    return spawnable
+
+
+def _start(spawnable, linked):
+    if _tracer is not None:
+        _tracer('spawn', time.time(), spawnable.actor_id, _current_id(),
+                linked)
+    gevent.spawn_later(0, spawnable.switch)
+    return spawnable.address
+
+
 def spawn(spawnable, *args, **kw):
     """Start a new Actor. If spawnable is a subclass of Actor,
     instantiate it with no arguments and call the Actor's "main"
@@ -105,20 +280,18 @@ def spawn(spawnable, *args, **kw):
     argument being the "receive" method to use to retrieve messages out
     of the Actor's mailbox,  followed by the given *args and **kw.
 
+    The keyword arguments mailbox_size and mailbox_policy are not
+    passed on, but override the Actor class attributes of the same
+    name for the new Actor.
+
     Return the Address of the new Actor.
     """
-    if is_actor_type(spawnable):
-        spawnable = spawnable()
-    else:
-        spawnable = Actor(spawnable)
-
-    spawnable._args = (args, kw)
-    gevent.spawn_later(0, spawnable.switch)
-    return spawnable.address
+    spawnable = _instantiate(spawnable, args, kw)
+    return _start(spawnable, 0)
 
 
 def spawn_link(spawnable, *args, **kw):
-    """Just like spawn, but call actor.add_link(gevent.getcurrent().address)
+    """Just like spawn, but call actor.add_link(curaddr())
     before returning the newly-created actor.
 
     The currently running Actor will be linked to the new actor. If an
@@ -137,15 +310,132 @@ def spawn_link(spawnable, *args, **kw):
 
         {'address': gevent.actor.Address, 'exit': object}
     """
-    if is_actor_type(spawnable):
-        spawnable = spawnable()
-    else:
-        spawnable = Actor(spawnable)
+    spawnable = _instantiate(spawnable, args, kw)
+    spawnable.add_link(curaddr())
+    return _start(spawnable, 1)
 
-    spawnable._args = (args, kw)
-    spawnable.add_link(gevent.getcurrent().address)
-    gevent.spawn_later(0, spawnable.switch)
-    return spawnable.address
+
+def spawn_many(spawnable, arg_list, link=False, **kw):
+    """Start one Actor for each item in arg_list, just like spawn.
+    Tuples in arg_list are the positional arguments of an Actor, and
+    any other item is its only argument. The keyword arguments are
+    given to every Actor. If link is True, link the current Actor to
+    all of them, as spawn_link does.
+
+    Unlike calling spawn in a loop, this schedules all the Actors with
+    a single callback, which is much cheaper when there are many.
+
+    Return the list of Addresses of the new Actors.
+    """
+    current = curaddr()
+    spawned = []
+    for args in arg_list:
+        if not isinstance(args, tuple):
+            args = (args,)
+        new = _instantiate(spawnable, args, dict(kw))
+        if link:
+            new.add_link(current)
+        if _tracer is not None:
+            _tracer('spawn', time.time(), new.actor_id, _current_id(),
+                    int(link))
+        spawned.append(new)
+    gevent.get_hub().loop.run_callback(_switch_all, spawned)
+    return [spawned_actor.address for spawned_actor in spawned]
+
+
+def _switch_all(spawned):
+    ## Runs in the hub; each switch returns once the Actor blocks.
+    for new in spawned:
+        if not new.dead:
+            new.switch()
+
+
+def multicast(addresses, message, codec=None):
+    """Cast message to every Address in addresses.
+
+    The message is encoded once per codec instead of once per
+    recipient, which makes this much cheaper than calling cast in a
+    loop when there are many recipients. Addresses of Actors which are
+    no longer running are skipped instead of raising DeadActor.
+
+    Return the number of Actors the message was delivered to. Messages
+    to Actors on other nodes are always counted as delivered. Actors
+    whose mailbox is full and which have the 'error' mailbox_policy
+    are skipped, and so are Actors which exit while the sender waits
+    for room in their mailbox.
+    """
+    if hasattr(message,'_as_json_obj'):
+        message = message._as_json_obj()
+    payloads = {}
+    delivered = 0
+    for address in addresses:
+        if not address.local:
+            address.cast(message)
+            delivered += 1
+            continue
+        try:
+            actor = address._actor
+        except DeadActor:
+            continue
+        actor_codec = _lookup_codec(codec or actor.codec)
+        if actor_codec.reusable and actor_codec in payloads:
+            payload = payloads[actor_codec]
+        else:
+            payload = payloads[actor_codec] = actor_codec.encode(message)
+        if _tracer is not None:
+            _tracer('send', time.time(), _current_id(), actor.actor_id, 0)
+        try:
+            actor._cast(payload, actor_codec)
+        except (DeadActor, MailboxFull):
+            continue
+        delivered += 1
+    return delivered
+
+
+def send_after(address, delay, message):
+    """Cast message to address in delay seconds. Return a
+    pyact.timer.Timer; cancel it to keep the message from being sent.
+    The message is dropped if the Actor has exited by then, or if its
+    mailbox is full.
+    """
+    return timer.call_later(delay, _send_timed, address, message)
+
+
+def send_interval(address, interval, message):
+    """Cast message to address every interval seconds, until the
+    pyact.timer.Timer which is returned is cancelled or the Actor
+    exits.
+    """
+    return timer.call_every(interval, _send_timed, address, message)
+
+
+def _send_timed(address, message):
+    ## Called in the hub, which must not block.
+    try:
+        address.cast(message)
+    except DeadActor:
+        return False
+    except MailboxFull:
+        pass
+
+
+def _wake(actor):
+    ## A receive timed out. Like a gevent.Timeout, interrupt the wait
+    ## from the hub; if the Actor is not waiting, receive will find
+    ## the timer inactive.
+    if actor._wevent is not None:
+        actor.throw(ReceiveTimeout)
+
+
+def _call_timed_out(future, seconds):
+    if not future.ready():
+        future.set_exception(gevent.Timeout(seconds))
+
+
+def _call_async_timed_out(actor, message_id, seconds):
+    slot = actor._calls and actor._calls.pop(message_id, None)
+    if slot is not None:
+        slot[1].set_exception(gevent.Timeout(seconds))
 
 
 def handle_custom(obj):
@@ -153,15 +443,73 @@ def handle_custom(obj):
         return obj.to_json()
     raise TypeError(obj)
 
+def copy_message(message):
+    """Return a copy of message that shares no mutable state with it.
+
+    This is what the "copy" codec uses instead of encoding the
+    message.  The same types that can be
+    sent as JSON are supported, but tuples stay tuples and strings are
+    not converted to unicode.  Address objects are passed as is.
+    """
+    try:
+        copier = _copiers[type(message)]
+    except KeyError:
+        if isinstance(message, Address):
+            return message
+        raise TypeError(message)
+    return copier(message)
+
+def _copy_dict(message):
+    result = {}
+    for key, value in message.iteritems():
+        if type(value) in _immutable_types:
+            result[key] = value
+        else:
+            result[key] = copy_message(value)
+    return result
+
+def _copy_list(message):
+    return [item if type(item) in _immutable_types else copy_message(item)
+            for item in message]
+
+def _copy_immutable(message):
+    return message
+
+_immutable_types = frozenset([str, unicode, int, long, float, bool,
+                              type(None)])
+_copiers = {
+    dict: _copy_dict,
+    list: _copy_list,
+    tuple: lambda message: tuple(_copy_list(message)),
+    set: lambda message: set(_copy_list(message)),
+    }
+for _type in _immutable_types:
+    _copiers[_type] = _copy_immutable
+
 def generate_custom(obj):
-    address = Address.from_json(obj)
-    if address: 
-        return address
-    binary = Binary.from_json(obj)
-    if binary:
-        return binary
+    ## Tagged Address and Binary objects are dicts with a single key,
+    ## or two for Addresses on other nodes, so don't bother looking any
+    ## closer at anything else.
+    if len(obj) == 1:
+        if '_pyact_address' in obj:
+            return Address.lookup(obj['_pyact_address'])
+        if '_pyact_binary' in obj:
+            return Binary(base64.b64decode(obj['_pyact_binary']))
+    elif len(obj) == 2 and '_pyact_node' in obj and '_pyact_address' in obj:
+        return remote_address(obj['_pyact_node'], obj['_pyact_address'])
     return obj
 
+
+def remote_address(node_name, actor_id):
+    """Return an Address for the Actor with actor_id on the named
+    node. This needs a running pyact.node.Node.
+    """
+    if _remote_address_factory is None:
+        raise LookupError("no node is running, can not resolve %s on %s" % (
+                actor_id, node_name))
+    return _remote_address_factory(node_name, actor_id)
+
+
 class Binary(object):
     """A custom Binary object. Wrap binaries in this class before
     sending them inside messages.
@@ -174,7 +522,7 @@ class Binary(object):
     
     @classmethod
     def from_json(cls,obj):
-        if obj.keys() == ['_pyact_binary']:
+        if len(obj) == 1 and '_pyact_binary' in obj:
             return cls(base64.b64decode(obj['_pyact_binary']))
         return None
     
@@ -199,6 +547,11 @@ class Address(object):
     called a "cast". To send a message to another Actor and wait for a response,
     use "call" instead.
     """
+    __slots__ = ('__actor',)
+
+    ## False for Addresses of Actors on other nodes.
+    local = True
+
     def __init__(self, actor):
         self.__actor = weakref.ref(actor)
 
@@ -207,13 +560,16 @@ class Address(object):
     
     @classmethod
     def from_json(cls,obj):
-        if obj.keys() == ['_pyact_address']:
-            return Actor.all_actors[obj['_pyact_address']].address
+        if len(obj) == 1 and '_pyact_address' in obj:
+            return Address.lookup(obj['_pyact_address'])
         return None
 
     @staticmethod
     def lookup(name):
         """Return the Address of an Actor given the actor_id as a string.
+
+        Every Actor has exactly one Address object, so Addresses can be
+        compared and hashed by identity.
         """
         return Actor.all_actors[name].address
 
@@ -235,10 +591,13 @@ class Address(object):
         Actor has an exception or exits, a message will be cast to the current
         Actor containing details about the exception or return result.
         """
-        self._actor.add_link(gevent.getcurrent().address, trap_exit=trap_exit)
+        self._actor.add_link(curaddr(), trap_exit=trap_exit)
 
-    def cast(self, message):
+    def cast(self, message, codec=None):
         """Send a message to the Actor this object addresses.
+
+        The message is encoded with the named codec if given, or else
+        with the codec of the receiving Actor. See pyact.codec.
         """
         ## If messages are any Python objects (not necessarily dicts), 
         ## but they specify the _as_json_obj() method, that method 
@@ -246,7 +605,13 @@ class Address(object):
         ## object.
         if hasattr(message,'_as_json_obj'):
             message = message._as_json_obj()
-        self._actor._cast(json.dumps(message, default=handle_custom))
+        actor = self._actor
+        if _tracer is not None:
+            _tracer('send', time.time(), _current_id(), actor.actor_id, 0)
+        codec = _lookup_codec(codec or actor.codec)
+        actor._cast(codec.encode(message), codec)
+
+    cast_many = staticmethod(multicast)
 
     def __or__(self, message):
         """Use Erlang-y syntax (| instead of !) to send messages.
@@ -262,33 +627,64 @@ class Address(object):
         gevent.TimeoutError if no result is returned in less than the timeout.
         
         This could have nicer syntax somehow to make it look like an actual method call.
+
+        The response is picked up by the calling Actor as soon as it
+        arrives, without going through its mailbox, so the time it
+        takes to find it does not depend on how many messages are
+        waiting there.
+        """
+        message_id, future = self._call(method, message)
+        if timeout is not None:
+            timeout_timer = timer.call_later(timeout, _call_timed_out,
+                                             future, timeout)
+        try:
+            return future.get()
+        finally:
+            if timeout is not None:
+                timeout_timer.cancel()
+            _current_actor()._calls.pop(message_id, None)
+
+    def call_async(self, method, message=None, timeout=None):
+        """Send a call message to the Actor this object addresses, but
+        do not wait for the result. Return a gevent AsyncResult which
+        gets the result once the response arrives; its get method
+        raises RemoteAttributeError or RemoteException just like call.
+
+        The reply slot of the call is kept until the response arrives.
+        If a timeout in seconds is passed, the slot is dropped when it
+        runs out and the AsyncResult gets a gevent.Timeout instead.
+        Without one, a call to an Actor which dies or never answers
+        is never completed, and waiting on it blocks forever.
+
+        Use wait_futures to wait for several calls at once.
+        """
+        message_id, future = self._call(method, message)
+        if timeout is not None:
+            timeout_timer = timer.call_later(
+                timeout, _call_async_timed_out, _current_actor(),
+                message_id, timeout)
+            future.rawlink(lambda future: timeout_timer.cancel())
+        return future
+
+    def _call(self, method, message):
+        """Cast a call message and register a reply slot for its
+        response with the current Actor. Return the message id and
+        the AsyncResult which will get the result.
         """
-        message_id = str(uuid.uuid1())
-        my_address = gevent.getcurrent().address
-        self.cast(
+        message_id = unique_id()
+        current = _current_actor()
+        future = event.AsyncResult()
+        if current._calls is None:
+            current._calls = {}
+        current._calls[message_id] = (method, future)
+        try:
+            self.cast(
                 {'call': message_id, 'method': method,
-                'address': my_address, 'message': message})
-        if timeout is None:
-            cancel = None
-        else:
-            ## Raise any Timeout to the caller so they can handle it
-            cancel = gevent.Timeout(timeout)
-            cancel.start()
-
-        RSP = {'response': message_id, 'message': object}
-        EXC = {'response': message_id, 'exception': object}
-        INV = {'response': message_id, 'invalid_method': str}
-
-        pattern, response = gevent.getcurrent().receive(RSP, EXC, INV)
-
-        if cancel is not None:
-            cancel.cancel()
-
-        if pattern is INV:
-            raise RemoteAttributeError(method)
-        elif pattern is EXC:
-            raise RemoteException(response)
-        return response['message']
+                 'address': current.address, 'message': message})
+        except:
+            del current._calls[message_id]
+            raise
+        return message_id, future
 
     def __getattr__(self,method):
         """Support address.<method>(message,timout) call pattern.
@@ -309,7 +705,26 @@ class Address(object):
         """Violently kill the Actor at this Address. Any other Actor which has
         called wait on this Address will get a Killed exception.
         """
-        gevent.kill(self._actor, Killed)
+        self._actor.kill(Killed, block=False)
+
+    def _rebind(self, actor):
+        """For internal use.
+
+        Make this the Address of actor, which takes over the identity
+        of the Actor this used to be the Address of.
+        """
+        self.__actor = weakref.ref(actor)
+
+
+_copiers[Address] = _copy_immutable
+_copiers[Binary] = lambda message: Binary(message.value)
+
+codec.register_extension(Address, 1, lambda address: address.actor_id,
+                         Address.lookup)
+codec.register_extension(Binary, 2, lambda binary: binary.value, Binary)
+codec.register(codec.JSONCodec(handle_custom, generate_custom))
+codec.register(codec.CopyCodec(copy_message))
+_lookup_codec = codec.lookup
 
 
 CALL_PATTERN = {'call': str, 
@@ -324,18 +739,29 @@ RESPONSE_PATTERN = {'response': str, 'message': object}
 INVALID_METHOD_PATTERN = {'response': str, 'invalid_method': str}
 EXCEPTION_PATTERN = {'response': str, 'exception':object}
 
+## Matchers for the patterns above which are checked for every message,
+## compiled once rather than looked up again each time.
+_match_call = shape.compile(CALL_PATTERN)
+
 def build_call_pattern(method,message=object):
     call_pat = CALL_PATTERN.copy()
     call_pat['method'] = method
     call_pat['message'] = message
     return call_pat
 
-def lazy_property(property_name, property_factory, doc=None):
-    def get(self):
-        if not hasattr(self, property_name):
-            setattr(self, property_name, property_factory(self))
-        return getattr(self, property_name)
-    return property(get)
+def _respond(orig_message, key, value):
+    """Cast the response to the call message orig_message to the
+    caller, with value under key: 'message', 'invalid_method' or
+    'exception'. Used by Actor and by pyact.callback.
+    """
+    if not _match_call(orig_message):
+        raise InvalidCallMessage(str(orig_message))
+    orig_message['address'].cast({'response': orig_message['call'],
+                                  key: value})
+
+## The links of an Actor which has never been linked to. Shared, so
+## that idle Actors do not need lists of their own.
+_NO_LINKS = ()
 
 
 class Actor(gevent.Greenlet):
@@ -359,39 +785,134 @@ class Actor(gevent.Greenlet):
     is (matched_pattern, message). To receive any message which is in
     the mailbox, simply call receive with no patterns.
     """
-    _wevent = None
-    _mailbox = lazy_property('_p_mailbox', lambda self: [])
-    _alinks = lazy_property('_p_links', lambda self: [])
-    _exit_links = lazy_property('_p_exit_links', lambda self: [])
-    _exit_event = lazy_property('_p_exit_event', lambda self: event.AsyncResult())
-
-    address = lazy_property('_p_address', lambda self: Address(self),
-        doc="""An Address is a reference to another Actor. See the Address
-        documentation for details. The address property is the Address
-        of this Actor.
-        """)
+    ## Actors keep no per-instance attributes beyond the slots, to keep
+    ## idle Actors small. greenlet still offers a __dict__, created on
+    ## first use, and subclasses which do not declare __slots__ use it
+    ## as usual.
+    ##
+    ## address is the Address of this Actor, and the only Address
+    ## object there is for it. See the Address documentation.
+    __slots__ = ('address', '_actor_id', '_mailbox', '_to_run', '_args',
+                 '_wevent', '_calls', '_alinks', '_exit_links',
+                 '_p_exit_event', '_mailbox_size', '_mailbox_policy',
+                 '_space_event', '_trace_seq', '_trace_seqs', 'dropped',
+                 'messages_received', 'messages_matched',
+                 'mailbox_high_water', 'receive_wait', 'calls_served',
+                 'hibernating', 'hibernations', 'reclaimed_bytes')
+
+    ## Name of the codec used for messages cast to this Actor, or None
+    ## to use the process default. See pyact.codec.
+    codec = None
+
+    ## The most messages the mailbox may hold, or None for no limit.
+    ## When the mailbox is full, mailbox_policy decides what happens to
+    ## the next message cast to this Actor:
+    ##
+    ##  * 'block': the sender waits until there is room.
+    ##  * 'drop_newest': the message is thrown away.
+    ##  * 'drop_oldest': the oldest message in the mailbox is thrown
+    ##    away to make room.
+    ##  * 'error': the sender gets a MailboxFull exception.
+    ##
+    ## Responses to calls made by this Actor do not go through the
+    ## mailbox, so they are never affected. Both can also be given to
+    ## spawn.
+    mailbox_size = None
+    mailbox_policy = 'block'
 
     spawn = classmethod(spawn)
     spawn_link = classmethod(spawn_link)
+    spawn_many = classmethod(spawn_many)
 
     all_actors = {}
 
     actor_id = property(lambda self: self._actor_id)
 
     def __init__(self, run=None):
-        if run is None:
-            self._to_run = self.main
-        else:
-            self._to_run = lambda *args, **kw: run(self.receive, *args, **kw)
+        ## None to run main.
+        self._to_run = run
         gevent.Greenlet.__init__(self)
 
-        self._actor_id = str(uuid.uuid1())
+        self._mailbox = mailbox.Mailbox()
+        self.address = Address(self)
+        self._actor_id = unique_id()
         self.all_actors[self.actor_id] = self
 
+        self._wevent = None
+        self._calls = None
+        self._alinks = self._exit_links = _NO_LINKS
+        self._p_exit_event = None
+        self._mailbox_size = self.mailbox_size
+        self._mailbox_policy = self.mailbox_policy
+
+        ## Set while senders are blocked on a full mailbox.
+        self._space_event = None
+
+        ## While a tracer is installed, the number of the last message
+        ## put in the mailbox, and the numbers of the messages in it by
+        ## id.
+        self._trace_seq = 0
+        self._trace_seqs = None
+
+        ## Number of messages thrown away because the mailbox was full.
+        self.dropped = 0
+
+        ## Whether this Actor is hibernating, how many times it has
+        ## and roughly how many bytes that released. See hibernate.
+        self.hibernating = False
+        self.hibernations = 0
+        self.reclaimed_bytes = 0
+
+        ## Counters reported by metrics, kept while METRICS is on.
+        self.messages_received = 0
+        self.messages_matched = 0
+        self.mailbox_high_water = 0
+        self.receive_wait = 0.0
+        self.calls_served = 0
+
+    @property
+    def _exit_event(self):
+        exit_event = self._p_exit_event
+        if exit_event is None:
+            exit_event = self._p_exit_event = event.AsyncResult()
+        return exit_event
+
     #######
     ## Methods for general use
     #######
 
+    def metrics(self):
+        """Return a dict with the counters of this Actor:
+
+         * mailbox: the number of messages in the mailbox.
+         * mailbox_high_water: the most messages there have been.
+         * messages_received: messages put in the mailbox.
+         * messages_matched: messages taken out of it by receive.
+         * dropped: messages thrown away because it was full.
+         * pattern_tests: messages tested against a pattern by a
+           selective receive.
+         * receive_wait: seconds spent waiting in receive.
+         * calls_served: calls a Server has responded to.
+         * hibernated: 1 if the Actor is hibernating, 0 if not.
+         * hibernations: how many times it has hibernated.
+         * reclaimed_bytes: an estimate of the memory hibernating has
+           released: the frames thrown away and the mailbox storage.
+
+        pattern_tests, dropped and the hibernation counters are always
+        counted; the rest only while METRICS is on.
+        """
+        return {'mailbox': len(self._mailbox),
+                'mailbox_high_water': self.mailbox_high_water,
+                'messages_received': self.messages_received,
+                'messages_matched': self.messages_matched,
+                'dropped': self.dropped,
+                'pattern_tests': self._mailbox.tests,
+                'receive_wait': self.receive_wait,
+                'calls_served': self.calls_served,
+                'hibernated': int(self.hibernating),
+                'hibernations': self.hibernations,
+                'reclaimed_bytes': self.reclaimed_bytes}
+
     def rename(self, name):
         """Change this actor's public name on this server.
         """
@@ -407,13 +928,26 @@ class Actor(gevent.Greenlet):
         along with the pattern it matched. If message doesn't
         match any pattern then None,None is returned.
         """
-        for i, message in enumerate(self._mailbox):
-            for pattern in patterns:
-                if shape.is_shaped(message, pattern):
-                    del self._mailbox[i]
-                    return pattern, message
-        return None,None
-        
+        matched = self._mailbox.scan(patterns)
+        if matched[0] is not None:
+            if METRICS:
+                self.messages_matched += 1
+            if _tracer is not None:
+                self._trace_match(matched[1])
+            if self._space_event is not None:
+                self._wake_senders()
+        return matched
+
+    def _popleft(self):
+        message = self._mailbox.popleft()
+        if METRICS:
+            self.messages_matched += 1
+        if _tracer is not None:
+            self._trace_match(message)
+        if self._space_event is not None:
+            self._wake_senders()
+        return message
+
     def receive(self, *patterns, **kw):
         """Select a message out of this Actor's mailbox. If patterns
         are given, only select messages which match these shapes.
@@ -423,58 +957,57 @@ class Actor(gevent.Greenlet):
         if timeout == 0 :
             if not patterns:
                 if self._mailbox:
-                    return {object: object}, self._mailbox.pop(0)
+                    return {object: object}, self._popleft()
                 else:
                     return None,None
             return self._match_patterns(patterns)
-        if timeout is not None:
-            timer = gevent.Timeout(kw['timeout'], ReceiveTimeout)
-            timer.start()
-        else:
-            timer = None
+        timeout_timer = None
         try:
             while True:
                 if patterns:
                     matched_pat, matched_msg = self._match_patterns(patterns)
                 elif self._mailbox:
-                    matched_pat, matched_msg = {object:object},self._mailbox.pop(0)
+                    matched_pat, matched_msg = {object:object},self._popleft()
                 else:
                     matched_pat = None
                 if matched_pat is not None:
-                    if timer:
-                        timer.cancel()
                     return matched_pat,matched_msg
+                if timeout is None:
+                    pass
+                elif timeout_timer is None:
+                    ## Only arm the timer when there is something to
+                    ## wait for. See pyact.timer: the deadline is
+                    ## rounded up to a tick.
+                    timeout_timer = timer.call_later(timeout, _wake, self)
+                elif not timeout_timer.active:
+                    if _tracer is not None:
+                        _tracer('timeout', time.time(), self.actor_id,
+                                None, 0)
+                    return (None,None)
                 self._wevent = event.Event()
+                started = METRICS and time.time()
                 try:
                     # wait until at least one message or timeout
                     self._wevent.wait()
+                except ReceiveTimeout:
+                    pass
                 finally:
                     self._wevent = None
-        except ReceiveTimeout:
-            return (None,None)
-        #except gevent.Timeout, t:
-        #    if t is not timer:
-        #        raise
-        #    return (None,None)
+                    if started:
+                        self.receive_wait += time.time() - started
+        finally:
+            if timeout_timer is not None:
+                timeout_timer.cancel()
 
 
     def respond(self, orig_message, response=None):
-        if not shape.is_shaped(orig_message, CALL_PATTERN):
-            raise InvalidCallMessage(str(orig_message))
-        orig_message['address'].cast({'response':orig_message['call'],
-                                      'message':response})
+        _respond(orig_message, 'message', response)
 
     def respond_invalid_method(self, orig_message, method):
-        if not shape.is_shaped(orig_message, CALL_PATTERN):
-            raise InvalidCallMessage(str(orig_message))
-        orig_message['address'].cast({'response':orig_message['call'],
-                                      'invalid_method':method})
+        _respond(orig_message, 'invalid_method', method)
 
     def respond_exception(self, orig_message, exception):
-        if not shape.is_shaped(orig_message, CALL_PATTERN):
-            raise InvalidCallMessage(str(orig_message))
-        orig_message['address'].cast({'response':orig_message['call'],
-                                      'exception':exception})
+        _respond(orig_message, 'exception', exception)
     def add_link(self, address, trap_exit=True):
         """Link the Actor at the given Address to this Actor.
 
@@ -483,10 +1016,31 @@ class Actor(gevent.Greenlet):
         containing the Actor's return value when the Actor exits.
         """
         assert isinstance(address, Address)
+        if self._alinks is _NO_LINKS:
+            self._alinks = []
         self._alinks.append(address)
         if trap_exit:
+            if self._exit_links is _NO_LINKS:
+                self._exit_links = []
             self._exit_links.append(address)
 
+    def hibernate(self, continuation, *args, **kw):
+        """Throw away the stack of this Actor and wait until there is
+        a message in the mailbox, then carry on with
+        continuation(receive, *args, **kw), called just like the
+        function given to spawn. What the continuation returns is the
+        result of the Actor. Like Erlang's hibernate/3, this never
+        returns.
+
+        Only the current Actor can hibernate. The stack is unwound by
+        raising an exception which is not an Exception: finally
+        clauses run, but bare except clauses must re-raise it. The
+        mailbox storage is shrunk to fit the messages in it.
+        """
+        if gevent.getcurrent() is not self:
+            raise ActorError("only the current actor can hibernate")
+        raise _Hibernate(continuation, args, kw)
+
     def main(self, *args, **kw):
         """If subclassing Actor, override this method to implement the Actor's
         main loop.
@@ -516,7 +1070,21 @@ class Actor(gevent.Greenlet):
         to_run = self._to_run
         del self._to_run
         try:
-            result = to_run(*args, **kw)
+            while True:
+                try:
+                    if to_run is None:
+                        result = self.main(*args, **kw)
+                    else:
+                        result = to_run(self.receive, *args, **kw)
+                    break
+                except _Hibernate, hibernation:
+                    to_run = hibernation.continuation
+                    args, kw = hibernation.args, hibernation.kw
+                    unwound = _unwound_bytes(sys.exc_info()[2])
+                ## Let go of the unwound frames before going to sleep.
+                del hibernation
+                sys.exc_clear()
+                self._hibernate(unwound)
             self._exit_event.set(result)
         except:
             exctype, excvalue, excinfo = sys.exc_info()
@@ -525,24 +1093,156 @@ class Actor(gevent.Greenlet):
                 traceback.print_exc()
             result = None
             formatted = exc.format_exc()
-            for link in self._alinks:
-                link.cast({'address': self.address, 'exception': formatted})
             self._exit_event.set_exception(excvalue)
-        for link in self._exit_links:
-            link.cast({'address': self.address, 'exit': result})
-        self.all_actors.pop(self.actor_id)
+        else:
+            formatted = None
+        if self._space_event is not None:
+            self._wake_senders()
+        _exited(self, result, formatted)
+
+    def _hibernate(self, unwound):
+        """Wait in hibernation until there is a message. unwound is
+        the size of the frames hibernate threw away.
+        """
+        self.reclaimed_bytes += unwound + self._mailbox.shrink()
+        self.hibernations += 1
+        self.hibernating = True
+        started = METRICS and time.time()
+        try:
+            while not self._mailbox:
+                self._wevent = event.Event()
+                try:
+                    self._wevent.wait()
+                finally:
+                    self._wevent = None
+        finally:
+            self.hibernating = False
+            if started:
+                self.receive_wait += time.time() - started
 
-    def _cast(self, message, as_json=True):
+    def _cast(self, message, codec=None):
         """For internal use.
         
         Address uses this to insert a message into this Actor's mailbox.
+        If codec is given, message is a payload encoded with it.
         """
-        if as_json:
-            message = json.loads(message, object_hook=generate_custom)
+        if codec is not None:
+            message = codec.decode(message)
+        if self._calls and self._complete_call(message):
+            if _tracer is not None:
+                _tracer('deliver', time.time(), self.actor_id,
+                        _current_id(), 0)
+            return
+        if self._mailbox_size is not None and \
+                len(self._mailbox) >= self._mailbox_size:
+            room = False
+            try:
+                room = self._make_room()
+            finally:
+                if not room and _tracer is not None:
+                    _tracer('drop', time.time(), self.actor_id,
+                            _current_id(), 0)
+            if not room:
+                return
         self._mailbox.append(message)
+        if METRICS:
+            self.messages_received += 1
+            if len(self._mailbox) > self.mailbox_high_water:
+                self.mailbox_high_water = len(self._mailbox)
+        if _tracer is not None:
+            self._trace_deliver(message)
         if self._wevent and not self._wevent.is_set():
             self._wevent.set()
 
+    def _trace_deliver(self, message):
+        self._trace_seq += 1
+        if self._trace_seqs is None:
+            self._trace_seqs = {}
+        ## Equal immutable messages may be the same object, so keep a
+        ## list of numbers per object, oldest first.
+        self._trace_seqs.setdefault(id(message), []).append(self._trace_seq)
+        _tracer('deliver', time.time(), self.actor_id, _current_id(),
+                self._trace_seq)
+
+    def _trace_match(self, message):
+        _tracer('match', time.time(), self.actor_id, None,
+                self._trace_forget(message))
+
+    def _trace_forget(self, message):
+        seqs = self._trace_seqs and self._trace_seqs.get(id(message))
+        if not seqs:
+            return 0
+        seq = seqs.pop(0)
+        if not seqs:
+            del self._trace_seqs[id(message)]
+        return seq
+
+    def _make_room(self):
+        """Apply mailbox_policy to a full mailbox. Return True if the
+        new message should be put in the mailbox, and False if it
+        should be thrown away.
+        """
+        policy = self._mailbox_policy
+        if policy == 'drop_newest':
+            self.dropped += 1
+            return False
+        elif policy == 'drop_oldest':
+            message = self._mailbox.popleft()
+            if self._trace_seqs:
+                self._trace_forget(message)
+            self.dropped += 1
+            return True
+        elif policy == 'block':
+            current = _current_actor()
+            if current is self or current is gevent.get_hub() or \
+                    _handling is not None:
+                ## The receiver itself, the hub and callback handlers
+                ## must not block; nobody would make room.
+                raise MailboxFull(
+                    "can not wait for room in the mailbox of %s" % (
+                        self.actor_id,))
+            while len(self._mailbox) >= self._mailbox_size:
+                if self.dead:
+                    raise DeadActor(self.actor_id)
+                if self._space_event is None:
+                    self._space_event = event.Event()
+                self._space_event.wait()
+            return True
+        elif policy == 'error':
+            raise MailboxFull(
+                "%s has %d messages" % (self.actor_id, len(self._mailbox)))
+        raise ValueError("unknown mailbox policy: %r" % (policy,))
+
+    def _wake_senders(self):
+        ## Every blocked sender checks for room again; those that find
+        ## none wait on a new event.
+        space_event = self._space_event
+        self._space_event = None
+        space_event.set()
+
+
+    def _complete_call(self, message):
+        """Hand message to the reply slot of the outstanding call it is
+        a response to, if it is one. Return True if it was.
+        """
+        if type(message) is not dict:
+            return False
+        message_id = message.get('response')
+        if not isinstance(message_id, basestring) or \
+                message_id not in self._calls:
+            return False
+        method, future = self._calls[message_id]
+        if 'message' in message:
+            future.set(message['message'])
+        elif 'exception' in message:
+            future.set_exception(RemoteException(message['exception']))
+        elif 'invalid_method' in message:
+            future.set_exception(RemoteAttributeError(method))
+        else:
+            return False
+        del self._calls[message_id]
+        return True
+
 
 class Server(Actor):
     """An actor which responds to the call protocol by looking for the
@@ -550,7 +1250,21 @@ class Server(Actor):
 
     Also, Server provides start and stop methods which can be overridden
     to customize setup.
+
+    By default calls are handled one at a time. Set concurrency to
+    handle up to that many calls at the same time, each in a greenlet
+    of its own. Methods then run concurrently with each other. They
+    may call other actors, but must not call receive, since messages
+    go to the one mailbox of the Server. When concurrency calls are running,
+    overload_policy decides what happens to the next call: 'queue'
+    leaves it in the mailbox until a running call has finished, and
+    'reject' responds with a ServerBusy exception straight away.
     """
+    __slots__ = ()
+
+    concurrency = None
+    overload_policy = 'queue'
+
     def server_start(self, *args, **kw):
         """Override to be notified when the server starts.
         """
@@ -566,24 +1280,64 @@ class Server(Actor):
         
         Do not override.
         """
+        if self.overload_policy not in ('queue', 'reject'):
+            raise ValueError(
+                "unknown overload policy: %r" % (self.overload_policy,))
+        if self.concurrency is None:
+            pool = None
+        else:
+            pool = gevent.pool.Pool(self.concurrency)
         self.server_start(*args, **kw)
         try:
             while True:
                 pattern, message = self.receive(CALL_PATTERN)
-                method = getattr(self, message['method'], None)
-                if method is None:
-                    self.respond_invalid_method(message, message['method'])
-                    continue
-                try:
-                    self.respond(message, method(message['message']))
-                except Exception, e:
-                    formatted = exc.format_exc()
-                    self.respond_exception(message, formatted)
+                if pool is None:
+                    self._handle_call(message)
+                elif pool.full() and self.overload_policy == 'reject':
+                    self._reject_call(message)
+                else:
+                    ## Blocks until there is room in the pool.
+                    pool.start(_CallHandler(self, message))
         finally:
+            if pool is not None:
+                pool.kill()
             self.server_stop(*args, **kw)
 
+    def _handle_call(self, message):
+        method = getattr(self, message['method'], None)
+        if method is None:
+            self.respond_invalid_method(message, message['method'])
+            return
+        try:
+            self.respond(message, method(message['message']))
+        except Exception:
+            formatted = exc.format_exc()
+            self.respond_exception(message, formatted)
+        if METRICS:
+            self.calls_served += 1
+
+    def _reject_call(self, message):
+        try:
+            raise ServerBusy(
+                "%d calls in progress" % (self.concurrency,))
+        except ServerBusy:
+            self.respond_exception(message, exc.format_exc())
+
+
+class _CallHandler(gevent.Greenlet):
+    """The greenlet which handles a call for a concurrent Server. Calls
+    it makes are made on behalf of the Server, which picks up their
+    responses.
+    """
+    __slots__ = ('server',)
+
+    def __init__(self, server, message):
+        gevent.Greenlet.__init__(self, server._handle_call, message)
+        self.server = server
+
 
 class Gather(Actor):
+    __slots__ = ()
 
     def main(self, spawnable_list):
         address_list = [spawn_link(x) for x in spawnable_list]
@@ -597,12 +1351,32 @@ class Gather(Actor):
                 {'exception': object, 'address': object})
 
             messages[message['address']] = message
-            if address_list[current_index] in messages:
-                results.append(messages[address_list[current_index]])
+            while (current_index < len(address_list) and
+                   address_list[current_index] in messages):
+                results.append(messages.pop(address_list[current_index]))
                 current_index += 1
         return results
 
 
+def wait_futures(futures, timeout=None):
+    """Wait for all of the AsyncResults returned by Address.call_async
+    and return their values in the same order. If a call failed, its
+    exception is raised. If a timeout in seconds is passed, raise
+    gevent.Timeout if all results are not in within the timeout.
+
+    Without a timeout, here or to call_async, this blocks forever if
+    a callee dies before it answers.
+    """
+    if timeout is None:
+        return [future.get() for future in futures]
+    deadline = time.time() + timeout
+    results = []
+    for future in futures:
+        remaining = max(deadline - time.time(), 0)
+        results.append(future.get(timeout=remaining))
+    return results
+
+
 def wait_all(*spawnable_list):
     if len(spawnable_list) == 1 and isinstance(spawnable_list[0], list):
         spawnable_list = spawnable_list[0]
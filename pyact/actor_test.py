@@ -19,10 +19,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import time
 import unittest
 import gevent
 from pyact import actor
 from pyact import exc
+from pyact import timer
 import base64
 
 EXCEPTION_MARKER = "Child had an exception"
@@ -223,6 +225,137 @@ class TestActor(unittest.TestCase):
         self.assertEquals(actor.spawn(BinarySupervisor).wait(), actor.Binary('\x00\xffaa'))
             
 
+    def test_selective_receive_order(self):
+        """Assert that selective receive picks the oldest matching
+        message, also when the same patterns are used repeatedly and
+        when the set of patterns changes.
+        """
+        class Selective(actor.Actor):
+            def main(self):
+                for message in ['a', 1, 'b', 2, 'c']:
+                    self.address | message
+                result = []
+                result.append(self.receive(int)[1])
+                result.append(self.receive(int)[1])
+                result.append(self.receive(int, timeout=0)[1])
+                self.address | 3
+                result.append(self.receive(int)[1])
+                result.append(self.receive(str)[1])
+                result.append(self.receive()[1])
+                result.append(self.receive(str)[1])
+                return result
+
+        self.assertEquals(actor.spawn(Selective).wait(),
+                          [1, 2, None, 3, 'a', 'b', 'c'])
+
+    def test_receive_changed_pattern(self):
+        """Assert that a pattern which is changed between receives is
+        matched as it is now.
+        """
+        class Selective(actor.Actor):
+            def main(self):
+                self.address | {'k': 'x'}
+                pattern = {'k': int}
+                missed = self.receive(pattern, timeout=0)
+                pattern['k'] = str
+                return missed, self.receive(pattern, timeout=0)[1]
+
+        self.assertEquals(actor.spawn(Selective).wait(),
+                          ((None, None), {'k': 'x'}))
+
+
+    def test_copy_codec(self):
+        """Assert that actors using the copy codec get a private copy
+        of each message without a round-trip through JSON.
+        """
+        class Mutator(actor.Actor):
+            codec = 'copy'
+            def main(self):
+                pat, msg = self.receive({'items': list, 'reply': object})
+                msg['items'].append(4)
+                msg['reply'] | {'items': msg['items'],
+                                'pos': (1, 2),
+                                'data': actor.Binary('\x00')}
+
+        class Sender(actor.Actor):
+            codec = 'copy'
+            def main(self):
+                items = [1, 2, 3]
+                actor.spawn(Mutator) | {'items': items, 'reply': self.address}
+                pat, msg = self.receive()
+                return items, msg
+
+        items, msg = actor.spawn(Sender).wait()
+        self.assertEquals(items, [1, 2, 3])
+        self.assertEquals(msg, {'items': [1, 2, 3, 4], 'pos': (1, 2),
+                                'data': actor.Binary('\x00')})
+
+    def test_copy_message(self):
+        message = {'a': [1, {'b': (2, 'c')}], 'd': None}
+        copied = actor.copy_message(message)
+        self.assertEquals(copied, message)
+        self.assertFalse(copied['a'] is message['a'])
+        self.assertFalse(copied['a'][1] is message['a'][1])
+        self.assertRaises(TypeError, actor.copy_message, object())
+
+
+    def test_multicast(self):
+        """Assert that multicast delivers a message to every live
+        Address and skips dead ones.
+        """
+        def receiver(receive):
+            pat, msg = receive()
+            msg['items'].append(1)
+            msg['reply'] | msg['items']
+
+        class Broadcaster(actor.Actor):
+            def main(self, name):
+                dead = actor.spawn(foo)
+                dead.wait()
+                addresses = [actor.spawn(receiver), dead,
+                             actor.spawn(receiver)]
+                delivered = actor.multicast(
+                    addresses, {'items': [], 'reply': self.address},
+                    codec=name)
+                return delivered, [self.receive()[1], self.receive()[1]]
+
+        for name in ('json', 'copy'):
+            delivered, results = actor.spawn(Broadcaster, name).wait()
+            self.assertEquals(delivered, 2)
+            self.assertEquals(results, [[1], [1]])
+
+        class CastMany(actor.Actor):
+            def main(self):
+                address = actor.spawn(receiver)
+                actor.Address.cast_many(
+                    [address], {'items': [0], 'reply': self.address})
+                return self.receive()[1]
+
+        self.assertEquals(actor.spawn(CastMany).wait(), [0, 1])
+
+
+    def test_multicast_blocked_recipient_dies(self):
+        """Assert that multicast skips a recipient which dies while the
+        sender waits for room in its mailbox, and goes on with the rest.
+        """
+        def stuck(receive):
+            receive('never')
+
+        def sender(receive, addresses):
+            return actor.multicast(addresses, 'hello')
+
+        class Parent(actor.Actor):
+            def main(self):
+                full = actor.spawn(stuck, mailbox_size=1)
+                full | 'first'
+                result = actor.spawn(sender, [full, self.address])
+                gevent.sleep(0.01)
+                full.kill()
+                return result.wait(), self.receive(timeout=1)[1]
+
+        self.assertEquals(actor.spawn(Parent).wait(), (1, 'hello'))
+
+
     def test_receive_times_out(self):
         """Assert that calling with a timeout > 0.
         """
@@ -436,6 +569,206 @@ class TestActor(unittest.TestCase):
         self.assertEquals([1,2,3], result2)
 
 
+    def test_address_identity(self):
+        """Assert that decoding an Address gives back the one Address
+        object of the Actor.
+        """
+        class Echo(actor.Actor):
+            def main(self):
+                pat, msg = self.receive()
+                msg['reply'] | {'reply': msg['reply'], 'nested': [msg]}
+
+        class Sender(actor.Actor):
+            def main(self):
+                actor.spawn(Echo) | {'reply': self.address}
+                pat, msg = self.receive()
+                return (msg['reply'] is self.address and
+                        msg['nested'][0]['reply'] is self.address and
+                        actor.Address.lookup(self.actor_id) is self.address)
+
+        self.assertEquals(actor.spawn(Sender).wait(), True)
+        self.assertEquals(actor.generate_custom({'_pyact_binary': 'AA==', 'x': 1}),
+                          {'_pyact_binary': 'AA==', 'x': 1})
+
+
+    def cast_to_full_mailbox(self, count, **options):
+        """Cast count messages to an Actor spawned with the given
+        mailbox options, which does not receive any until the casts
+        are done. Return how many messages were waiting, the messages
+        it got, how many it dropped, and the casts which raised
+        MailboxFull.
+        """
+        def consumer(receive, count):
+            gevent.sleep(0.05)
+            me = gevent.getcurrent()
+            waiting = len(me._mailbox)
+            received = [receive()[1] for i in range(count)]
+            return waiting, received, me.dropped
+
+        class Producer(actor.Actor):
+            def main(self):
+                kept = min(count, options['mailbox_size'])
+                if options.get('mailbox_policy', 'block') == 'block':
+                    kept = count
+                address = actor.spawn(consumer, kept, **options)
+                failed = []
+                for i in range(count):
+                    try:
+                        address | i
+                    except actor.MailboxFull:
+                        failed.append(i)
+                return address.wait() + (failed,)
+
+        return actor.spawn(Producer).wait()
+
+    def test_mailbox_block(self):
+        self.assertEquals(self.cast_to_full_mailbox(5, mailbox_size=2),
+                          (2, range(5), 0, []))
+
+    def test_mailbox_drop_newest(self):
+        self.assertEquals(
+            self.cast_to_full_mailbox(5, mailbox_size=2,
+                                      mailbox_policy='drop_newest'),
+            (2, [0, 1], 3, []))
+
+    def test_mailbox_drop_oldest(self):
+        self.assertEquals(
+            self.cast_to_full_mailbox(5, mailbox_size=2,
+                                      mailbox_policy='drop_oldest'),
+            (2, [3, 4], 3, []))
+
+    def test_mailbox_error(self):
+        self.assertEquals(
+            self.cast_to_full_mailbox(5, mailbox_size=2,
+                                      mailbox_policy='error'),
+            (2, [0, 1], 0, [2, 3, 4]))
+
+    def test_mailbox_subclass(self):
+        """Assert that mailbox limits can be set on a subclass, and
+        that an Actor which casts to its own full mailbox gets
+        MailboxFull instead of waiting forever.
+        """
+        class Small(actor.Actor):
+            mailbox_size = 1
+
+            def main(self):
+                self.address | 'first'
+                try:
+                    self.address | 'second'
+                except actor.MailboxFull:
+                    return list(self._mailbox)
+
+        self.assertEquals(actor.spawn(Small).wait(), ['first'])
+
+
+    def test_spawn_many(self):
+        def add(receive, a, b=0, c=0):
+            return a + b + c
+
+        class Parent(actor.Actor):
+            def main(self):
+                addresses = actor.spawn_many(
+                    add, [1, (2, 3), (4,)], link=True, c=10)
+                results = {}
+                for address in addresses:
+                    pat, msg = self.receive(
+                        {'exit': object, 'address': object})
+                    results[msg['address']] = msg['exit']
+                return [results[address] for address in addresses]
+
+        self.assertEquals(actor.spawn(Parent).wait(), [11, 15, 14])
+
+    def test_spawn_many_subclass(self):
+        class Doubler(actor.Actor):
+            def main(self, value):
+                return value * 2
+
+        class Parent(actor.Actor):
+            def main(self):
+                Doubler.spawn_many(range(3), link=True)
+                return sorted([
+                        self.receive({'exit': object,
+                                      'address': object})[1]['exit']
+                        for i in range(3)])
+
+        self.assertEquals(actor.spawn(Parent).wait(), [0, 2, 4])
+
+
+    def test_compact_layout(self):
+        """Assert that an Actor keeps its state in slots, and that
+        Actors without links share an empty link list.
+        """
+        def idle(receive):
+            pat, msg = receive()
+            me = gevent.getcurrent()
+            return me.__dict__, me._alinks is actor._NO_LINKS
+
+        class Parent(actor.Actor):
+            def main(self):
+                child = actor.spawn(idle)
+                child | 'hello'
+                return child.wait()
+
+        self.assertEquals(actor.spawn(Parent).wait(), ({}, True))
+
+
+    def test_hibernate(self):
+        """Assert that a hibernating Actor unwinds its stack, including
+        except Exception clauses, and carries on with the continuation
+        and its arguments when a message arrives, with messages which
+        arrived meanwhile still in the mailbox.
+        """
+        def wake(receive, parent, seen):
+            pat, msg = receive()
+            if msg == 'stop':
+                return seen
+            seen = seen + [msg]
+            parent | seen
+            actor.hibernate(wake, parent, seen)
+
+        def sleeper(receive, parent):
+            try:
+                actor.hibernate(wake, parent, ['start'])
+            except Exception:
+                return 'caught'
+
+        class Parent(actor.Actor):
+            def main(self):
+                child = actor.spawn(sleeper, self.address)
+                gevent.sleep(0.01)
+                before = child._actor.metrics()
+                child | 'a'
+                first = self.receive()[1]
+                gevent.sleep(0.01)
+                after = child._actor.metrics()
+                child | 'b'
+                child | 'c'
+                replies = [self.receive()[1], self.receive()[1]]
+                child | 'stop'
+                return (before['hibernated'], first, after['hibernated'],
+                        after['hibernations'], replies, child.wait())
+
+        self.assertEquals(actor.spawn(Parent).wait(),
+                          (1, ['start', 'a'], 1, 2,
+                           [['start', 'a', 'b'], ['start', 'a', 'b', 'c']],
+                           ['start', 'a', 'b', 'c']))
+
+
+    def test_hibernate_kill(self):
+        class Parent(actor.Actor):
+            def main(self):
+                child = actor.spawn(
+                    lambda receive: actor.hibernate(lambda receive: None))
+                gevent.sleep(0.01)
+                child.kill()
+                try:
+                    child.wait()
+                except actor.Killed:
+                    return 'killed'
+
+        self.assertEquals(actor.spawn(Parent).wait(), 'killed')
+
+
     def test_build_call_pattern(self):
         
         assert actor.build_call_pattern('meth1') == {'address': actor.Address,
@@ -519,6 +852,140 @@ class TestServer(unittest.TestCase):
 		self.assertEqual(mutate_me.get('foo'), True)
 		self.assertEqual(mutate_me.get('stop'), True)
 
+	def call_concurrently(self, server_type, count):
+		class SimpleClient(actor.Actor):
+			def main(self):
+				server = server_type.spawn()
+				def call(receive, n):
+					try:
+						return server.slow(n)
+					except actor.RemoteException:
+						return 'busy'
+				for n in range(count):
+					actor.spawn_link(call, n)
+				return [self.receive({'exit': object, 'address': object})[1]['exit']
+						for n in range(count)]
+
+		cancel = gevent.Timeout(0.5)
+		try:
+			return SimpleClient.spawn().wait()
+		finally:
+			cancel.cancel()
+
+	def test_call_async(self):
+		class SlowServer(actor.Server):
+			def slow(self, message):
+				gevent.sleep(0.1)
+				return message
+
+			def fail(self, message):
+				raise RuntimeError(message)
+
+		class SimpleClient(actor.Actor):
+			def main(self):
+				servers = [SlowServer.spawn() for i in range(5)]
+				start = time.time()
+				futures = [server.call_async('slow', i)
+						   for i, server in enumerate(servers)]
+				result = actor.wait_futures(futures, timeout=1)
+				elapsed = time.time() - start
+				failed = servers[0].call_async('fail', 'x')
+				invalid = servers[1].call_async('nonexistent')
+				test.assertRaises(actor.RemoteException, failed.get)
+				test.assertRaises(actor.RemoteAttributeError, invalid.get)
+				return result, elapsed, len(self._mailbox)
+
+		test = self
+		result, elapsed, mailbox_size = SimpleClient.spawn().wait()
+		self.assertEquals(result, range(5))
+		self.assertEquals(mailbox_size, 0)
+		self.assertTrue(elapsed < 0.3)
+
+	def test_call_with_deep_mailbox(self):
+		class SimpleServer(actor.Server):
+			def foo(self, message):
+				return message
+
+		class SimpleClient(actor.Actor):
+			def main(self):
+				server = SimpleServer.spawn()
+				for i in range(1000):
+					self.address | 'parked'
+				results = [server.foo(i) for i in range(10)]
+				return results, len(self._mailbox)
+
+		self.assertEquals(SimpleClient.spawn().wait(), (range(10), 1000))
+
+	def test_wait_futures_timeout(self):
+		class SlowServer(actor.Server):
+			def slow(self, message):
+				gevent.sleep(1)
+
+		class SimpleClient(actor.Actor):
+			def main(self):
+				server = SlowServer.spawn()
+				actor.wait_futures([server.call_async('slow')], timeout=0.05)
+
+		self.assertRaises(gevent.Timeout, SimpleClient.spawn().wait)
+
+	def test_call_async_timeout(self):
+		class SimpleClient(actor.Actor):
+			def main(self):
+				server = actor.spawn(lambda receive: receive('stop'))
+				future = server.call_async('foo', timeout=0.05)
+				test.assertRaises(gevent.Timeout, future.get)
+				server.cast('stop')
+				answered = actor.spawn(actor.Server).call_async(
+					'nonexistent', timeout=1)
+				test.assertRaises(actor.RemoteAttributeError, answered.get)
+				## Let the timeout of the answered call be cancelled.
+				gevent.sleep()
+				return self._calls, timer.pending()
+
+		test = self
+		self.assertEquals(SimpleClient.spawn().wait(), ({}, 0))
+
+	def test_concurrency(self):
+		class SlowServer(actor.Server):
+			concurrency = 10
+			def slow(self, message):
+				gevent.sleep(0.1)
+				return message
+
+		self.assertEquals(sorted(self.call_concurrently(SlowServer, 10)),
+						  range(10))
+
+	def test_concurrent_calls_out(self):
+		"""Assert that the methods of a concurrent Server can call
+		other actors, and get their own responses.
+		"""
+		class Echo(actor.Server):
+			concurrency = 10
+			def echo(self, message):
+				gevent.sleep(0.1)
+				return message
+
+		class Frontend(actor.Server):
+			concurrency = 10
+			def server_start(self):
+				self.backend = Echo.spawn()
+			def slow(self, message):
+				return self.backend.echo(message)
+
+		self.assertEquals(sorted(self.call_concurrently(Frontend, 10)),
+						  range(10))
+
+	def test_overload_reject(self):
+		class SlowServer(actor.Server):
+			concurrency = 1
+			overload_policy = 'reject'
+			def slow(self, message):
+				gevent.sleep(0.05)
+				return message
+
+		result = self.call_concurrently(SlowServer, 2)
+		self.assertEquals(len(result), 2)
+		self.assertEquals(result.count('busy'), 1)
 
 if __name__ == '__main__':
     unittest.main()
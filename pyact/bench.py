@@ -0,0 +1,580 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Micro-benchmarks for python-actors.
+
+Run all benchmarks with:
+
+    python -m pyact.bench
+
+or only some of them by giving their names on the command line. With
+--json, every result is printed as a JSON object on a line of its
+own instead, which can be saved and passed to --compare in a later
+run to see how each result changed. --list lists the benchmarks.
+"""
+
+import gc
+import optparse
+import resource
+import sys
+import time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import gevent
+
+from pyact import actor
+from pyact import callback
+from pyact import codec
+from pyact import node
+from pyact import shape
+from pyact import timer
+
+
+BENCHMARKS = []
+
+## The results of the benchmarks run so far, as dicts. See report.
+RESULTS = []
+
+## Set by main: write results as JSON, and results of an earlier run
+## to compare with, by name.
+_json_output = False
+_baseline = {}
+
+
+def benchmark(func):
+    """Register func as a benchmark.
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+def timed(func, number):
+    """Call func number times and return the elapsed wall clock time.
+    """
+    start = time.time()
+    for i in xrange(number):
+        func()
+    return time.time() - start
+
+
+def report(name, number, elapsed, **extra):
+    """Record and print the result of a benchmark: number operations
+    took elapsed seconds. Extra keyword arguments are added to the
+    result as they are.
+    """
+    result = {'name': name, 'number': number, 'seconds': elapsed,
+              'usec_per_op': elapsed / number * 1e6}
+    result.update(extra)
+    RESULTS.append(result)
+    if _json_output:
+        print json.dumps(result, sort_keys=True)
+        return
+    line = "%-45s %10d %12.3f usec/op" % (
+        name, number, result['usec_per_op'])
+    baseline = _baseline.get(name)
+    if baseline is not None:
+        line += "  %6.2fx" % (result['usec_per_op'] /
+                              baseline['usec_per_op'],)
+    print line
+
+
+def report_size(name, number, nbytes):
+    """Record and print the result of a memory benchmark: number
+    objects took nbytes bytes.
+    """
+    result = {'name': name, 'number': number, 'bytes': nbytes,
+              'bytes_per_op': float(nbytes) / number}
+    RESULTS.append(result)
+    if _json_output:
+        print json.dumps(result, sort_keys=True)
+        return
+    line = "%-45s %10d %12.1f bytes/op" % (
+        name, number, result['bytes_per_op'])
+    baseline = _baseline.get(name)
+    if baseline is not None:
+        line += "  %6.2fx" % (result['bytes_per_op'] /
+                              baseline['bytes_per_op'],)
+    print line
+
+
+def resident_bytes():
+    """Return the resident set size of this process in bytes. Where
+    /proc is not available, return the peak resident set size instead.
+    """
+    try:
+        f = open('/proc/self/statm')
+    except IOError:
+        ## ru_maxrss is in kilobytes on Linux, bytes on Mac OS X.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    try:
+        return int(f.read().split()[1]) * resource.getpagesize()
+    finally:
+        f.close()
+
+
+def percentile(values, fraction):
+    """Return the value below which fraction of the sorted values are.
+    """
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+## (thing, shape) pairs taken from shape_test. Most of them are
+## mismatches, which is the common case in selective receive.
+SHAPE_CASES = [
+    ("hello", str),
+    ([1, 2, 3], [int]),
+    ({'a': 'b', 'c': 5}, {'a': str, 'c': int}),
+    ((1, 'a'), (int, str)),
+    (1, str),
+    ([1, 2, 3], bool),
+    ({'hello': 'world'}, int),
+    ((1, 2, 3), (int, int)),
+    ({'bar': 1}, {'foo': int}),
+    ([1, 2], [str]),
+    ((1, "hello", True), (int, str, str)),
+    ({'hello': 1, 'world': [{'abc': 'def'}, {'abc': 'def'}]},
+     {'hello': int, 'world': [{'abc': str}]}),
+    ({'hello': 'world'}, {'hello': 'something'}),
+]
+
+
+def _is_shaped_exc(thing, pattern):
+    try:
+        shape.is_shaped_exc(thing, pattern)
+        return True
+    except shape.ShapeMismatch:
+        return False
+
+
+@benchmark
+def shapes(number=20000):
+    """Match the shape_test cases, with and without compiled shapes.
+    """
+    def run(match):
+        for thing, pattern in SHAPE_CASES:
+            match(thing, pattern)
+    report('shape.is_shaped_exc', number, timed(
+            lambda: run(_is_shaped_exc), number))
+    report('shape.is_shaped', number, timed(
+            lambda: run(shape.is_shaped), number))
+    compiled = [(thing, shape.compile(pattern))
+                for thing, pattern in SHAPE_CASES]
+    def run_compiled():
+        for thing, match in compiled:
+            match(thing)
+    report('shape.compile (precompiled)', number, timed(
+            run_compiled, number))
+
+
+def _forward(receive, address):
+    pat, data = receive()
+    address | data
+
+
+def _ring(receive, n):
+    ring = []
+    for i in range(n):
+        if not ring:
+            node = actor.spawn(_forward, gevent.getcurrent().address)
+        else:
+            node = actor.spawn(_forward, ring[-1])
+        ring.append(node)
+    gevent.sleep()
+    start = time.time()
+    ring[-1] | {'text': 'hello around the ring'}
+    receive()
+    return time.time() - start
+
+
+@benchmark
+def ring(n=10000):
+    """The ring from the README: n actors that each forward a single
+    message to the next one.
+    """
+    for name in ('json', 'copy', 'marshal'):
+        codec.set_default(name)
+        try:
+            elapsed = actor.spawn(_ring, n).wait()
+        finally:
+            codec.set_default('json')
+        report('ring pass (%s)' % (name,), n, elapsed)
+
+
+def _codec_messages(address):
+    messages = [
+        ('small dict', {'text': 'hello around the ring'}),
+        ('call', {'call': '8c2d6f0a-5ab4-11e3-a4f1-001c42000009',
+                  'method': 'lookup', 'address': address,
+                  'message': {'key': 'abc', 'limit': 10}}),
+        ('list of 1000 ints', range(1000)),
+        ('nested dicts', {'users': [{'name': 'user%d' % i, 'id': i,
+                                     'tags': ['a', 'b']}
+                                    for i in range(100)]}),
+        ('binary 64k', actor.Binary('\xff' * 65536)),
+        ]
+    for size in (10, 100, 1000, 10000, 100000):
+        messages.append(('%d bytes of strings' % (size,),
+                         {'items': ['x' * 10] * (size // 10)}))
+    return messages
+
+
+@benchmark
+def codecs(number=200):
+    """Encode and decode cost and payload size per codec, for a few
+    typical messages and for messages of growing size.
+    """
+    ## An Address to put in the call message.
+    address = actor.spawn(lambda receive: receive('stop'))
+    try:
+        for label, message in _codec_messages(address):
+            for name in ('json', 'copy', 'marshal', 'pickle'):
+                c = codec.lookup(name)
+                payload = c.encode(message)
+                elapsed = timed(lambda: c.decode(c.encode(message)), number)
+                size = len(payload) if isinstance(payload, str) else 0
+                report('%s (%s)' % (label, name),
+                       number, elapsed, codec=name, payload_bytes=size)
+    finally:
+        address.cast('stop')
+        address.wait()
+
+
+def _fanout(receive, n, rounds):
+    addresses = [actor.spawn(lambda receive: receive('stop'))
+                 for i in range(n)]
+    gevent.sleep()
+    message = {'event': 'update', 'data': range(20)}
+    start = time.time()
+    for i in range(rounds):
+        for address in addresses:
+            address.cast(message)
+    loop = time.time() - start
+    start = time.time()
+    for i in range(rounds):
+        actor.multicast(addresses, message)
+    multicast = time.time() - start
+    actor.multicast(addresses, 'stop')
+    return loop, multicast
+
+
+@benchmark
+def fanout(n=1000, rounds=10):
+    """Cast one message to n actors, in a loop and with multicast.
+    """
+    loop, multicast = actor.spawn(_fanout, n, rounds).wait()
+    report('fan-out to %d (cast loop)' % (n,), n * rounds, loop)
+    report('fan-out to %d (multicast)' % (n,), n * rounds, multicast)
+
+
+def _spawn(receive, n):
+    start = time.time()
+    addresses = [actor.spawn_link(lambda receive: None) for i in range(n)]
+    for address in addresses:
+        receive({'exit': object, 'address': object})
+    return time.time() - start
+
+
+def _spawn_many(receive, n):
+    start = time.time()
+    actor.spawn_many(lambda receive, i: None, xrange(n), link=True)
+    for i in xrange(n):
+        receive({'exit': object, 'address': object})
+    return time.time() - start
+
+
+@benchmark
+def spawn(n=10000):
+    """Spawn n linked actors and wait for them all to exit, one by one
+    and with spawn_many.
+    """
+    report('spawn and exit', n, actor.spawn(_spawn, n).wait())
+    report('spawn_many and exit', n, actor.spawn(_spawn_many, n).wait())
+
+
+class _Echo(actor.Server):
+    def echo(self, message):
+        return message
+
+
+def _call(receive, n):
+    server = _Echo.spawn()
+    times = []
+    for i in range(n):
+        start = time.time()
+        server.echo(i)
+        times.append(time.time() - start)
+    server.kill()
+    return times
+
+
+def _idle(receive, n):
+    gc.collect()
+    before = resident_bytes()
+    addresses = actor.spawn_many(lambda receive: receive(), [()] * n)
+    gevent.sleep()
+    gc.collect()
+    used = resident_bytes() - before
+    actor.multicast(addresses, 'stop')
+    return used
+
+
+def _deep(receive, depth, hibernate):
+    ## Wait for a message with depth frames on the stack.
+    if depth:
+        return _deep(receive, depth - 1, hibernate)
+    if hibernate:
+        actor.hibernate(lambda receive: receive())
+    receive()
+
+
+def _idle_deep(receive, n, hibernate):
+    gc.collect()
+    before = resident_bytes()
+    addresses = actor.spawn_many(_deep, [(20, hibernate)] * n)
+    gevent.sleep()
+    gc.collect()
+    used = resident_bytes() - before
+    actor.multicast(addresses, 'stop')
+    return used
+
+
+def _idle_callback(receive, n):
+    gc.collect()
+    before = resident_bytes()
+    addresses = [callback.spawn(_stop_handler) for i in xrange(n)]
+    gc.collect()
+    used = resident_bytes() - before
+    actor.multicast(addresses, 'stop')
+    return used
+
+
+def _stop_handler(state, message):
+    return callback.stop()
+
+
+@benchmark
+def memory(n=100000):
+    """Resident memory per idle actor: spawn n actors which all wait
+    in receive, n which wait 20 calls deep, n which hibernate from
+    there, and n callback actors.
+    """
+    report_size('idle actor', n, actor.spawn(_idle, n).wait())
+    report_size('idle actor, 20 frames deep', n,
+                actor.spawn(_idle_deep, n, False).wait())
+    report_size('hibernated actor', n,
+                actor.spawn(_idle_deep, n, True).wait())
+    report_size('idle callback actor', n,
+                actor.spawn(_idle_callback, n).wait())
+
+
+@benchmark
+def call(n=10000):
+    """Call a local Server n times in a row, and report the median and
+    the 90th and 99th percentiles of the round-trip time.
+    """
+    times = actor.spawn(_call, n).wait()
+    ordered = sorted(times)
+    report('call round-trip', n, sum(times))
+    for label, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99),
+                            ('max', 1.0)):
+        report('call round-trip %s' % (label,), 1,
+               percentile(ordered, fraction))
+
+
+class _Deep(actor.Actor):
+    def main(self, depth, n):
+        for i in xrange(depth):
+            self.address | {'junk': i}
+        start = time.time()
+        for i in xrange(n):
+            self.address | {'wanted': i}
+            self.receive({'wanted': int})
+        return time.time() - start
+
+
+@benchmark
+def deep_mailbox(n=1000):
+    """Cast a message to self and receive it with a pattern, n times,
+    while 1k to 100k messages which do not match wait in the mailbox.
+    """
+    for depth in (1000, 10000, 100000):
+        report('selective receive past %d' % (depth,), n,
+               actor.spawn(_Deep, depth, n).wait())
+
+
+def _gather(receive, n):
+    start = time.time()
+    actor.wait_all([lambda receive: None] * n)
+    return time.time() - start
+
+
+def _futures(receive, n):
+    servers = [_Echo.spawn() for i in range(10)]
+    start = time.time()
+    actor.wait_futures([servers[i % 10].call_async('echo', i)
+                        for i in range(n)])
+    elapsed = time.time() - start
+    for server in servers:
+        server.kill()
+    return elapsed
+
+
+@benchmark
+def fan_in(n=10000):
+    """Collect the results of n actors with wait_all, and of n calls
+    to 10 Servers with wait_futures.
+    """
+    report('wait_all of %d actors' % (n,), n, actor.spawn(_gather, n).wait())
+    report('wait_futures of %d calls' % (n,), n,
+           actor.spawn(_futures, n).wait())
+
+
+def _gevent_timeout():
+    t = gevent.Timeout(60)
+    t.start()
+    t.cancel()
+
+
+def _wheel_timeout():
+    timer.call_later(60, None).cancel()
+
+
+def _timers_fired(arm, n, delay=0.05):
+    fired = []
+    start = time.time()
+    for i in xrange(n):
+        arm(delay, fired.append, i)
+    while len(fired) < n:
+        gevent.sleep(delay)
+    return time.time() - start
+
+
+def _gevent_later(delay, function, *args):
+    gevent.get_hub().loop.timer(delay).start(function, *args)
+
+
+def _time_out(receive, parent, rounds):
+    for i in xrange(rounds):
+        receive('never', timeout=0.01)
+    parent | 'done'
+
+
+def _receive_timeouts(receive, n, rounds):
+    start = time.time()
+    actor.spawn_many(_time_out, [(actor.curaddr(), rounds)] * n)
+    for i in xrange(n):
+        receive('done')
+    return time.time() - start
+
+
+@benchmark
+def timers(n=100000, pending=10000):
+    """Arm and cancel a timeout n times, as a receive which gets its
+    message in time does, with pending other timeouts armed; and arm
+    n timers which all fire 50ms later. Each with gevent timers and
+    with the pyact.timer wheel.
+    """
+    keep = [gevent.Timeout(60) for i in xrange(pending)]
+    for t in keep:
+        t.start()
+    report('timeout cancelled (gevent)', n, timed(_gevent_timeout, n))
+    for t in keep:
+        t.cancel()
+    keep = [timer.call_later(60, None) for i in xrange(pending)]
+    report('timeout cancelled (wheel)', n, timed(_wheel_timeout, n))
+    for t in keep:
+        t.cancel()
+    report('timers fired (gevent)', n, _timers_fired(_gevent_later, n))
+    report('timers fired (wheel)', n, _timers_fired(timer.call_later, n))
+    report('receive timed out, %d actors' % (n // 10,), n,
+           actor.spawn(_receive_timeouts, n // 10, 10).wait())
+
+
+def _remote(receive, n):
+    a = node.Node()
+    a.start()
+    b = node.Node()
+    b.start()
+    try:
+        def sink(receive, parent):
+            for i in range(n):
+                receive()
+            parent | 'done'
+        target = actor.spawn(sink, gevent.getcurrent().address)
+        remote = a.address(b.name, target.actor_id)
+        start = time.time()
+        for i in range(n):
+            remote | {'seq': i}
+        receive('done')
+        return time.time() - start, a.stats()
+    finally:
+        a.stop()
+        b.stop()
+
+
+@benchmark
+def remote(n=20000):
+    """Cast n messages to an actor on another node over loopback.
+    """
+    elapsed, stats = actor.spawn(_remote, n).wait()
+    report('remote cast', n, elapsed, frames_sent=stats['frames_sent'],
+           batches_sent=stats['batches_sent'])
+
+
+def main(argv):
+    global _json_output, _baseline
+    parser = optparse.OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--json', action='store_true',
+                      help='print results as JSON, one per line')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare with results saved from --json')
+    parser.add_option('--list', action='store_true',
+                      help='list the benchmarks and exit')
+    options, names = parser.parse_args(argv[1:])
+    if options.list:
+        for func in BENCHMARKS:
+            print "%-15s %s" % (func.__name__,
+                                (func.__doc__ or '').strip().split('\n')[0])
+        return
+    unknown = set(names) - set([func.__name__ for func in BENCHMARKS])
+    if unknown:
+        parser.error('unknown benchmarks: %s' % (', '.join(sorted(unknown)),))
+    _json_output = options.json
+    if options.compare:
+        f = open(options.compare)
+        try:
+            _baseline = dict([(result['name'], result)
+                              for result in map(json.loads, f)])
+        finally:
+            f.close()
+    for func in BENCHMARKS:
+        if not names or func.__name__ in names:
+            func()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
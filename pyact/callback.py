@@ -0,0 +1,347 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Callback actors.
+
+A callback actor is an actor without a greenlet of its own. Its
+behaviour is a handler function, which is called with the state of
+the actor and a message, and returns the new state:
+
+    def counter(state, message):
+        if message == 'stop':
+            return callback.stop(state)
+        return state + 1
+
+    address = callback.spawn(counter, 0)
+
+Callback actors with messages waiting are put in a shared run queue,
+and a single greenlet runs their handlers, one message at a time in
+the order they arrived. An idle callback actor is only a small
+object, so a process can hold many more of them than of greenlet
+actors.
+
+Callback actors have an Address like any other actor: they can be
+cast to, linked to, waited on, killed and called (see respond). The
+handler must not block; it can cast, but not call or receive. To get
+its own Address, use actor.curaddr(). When a callback actor needs to
+block, the handler returns promote(...), and the actor carries on as
+a greenlet actor with the same Address.
+"""
+
+import collections
+import sys
+import time
+import traceback
+
+from gevent import event
+import gevent
+
+from pyact import actor
+from pyact import exc
+
+
+## How many messages of one callback actor are handled before the
+## runner moves on to the next one, and how many messages the runner
+## handles before it lets other greenlets run.
+BATCH = 64
+YIELD_EVERY = 1024
+
+## Callback actors with messages waiting, and the greenlet which runs
+## them, if it is running.
+_run_queue = collections.deque()
+_runner = None
+
+
+class _Stop(object):
+    __slots__ = ('result',)
+
+    def __init__(self, result):
+        self.result = result
+
+
+class _Promote(object):
+    __slots__ = ('spawnable', 'args', 'kw')
+
+    def __init__(self, spawnable, args, kw):
+        self.spawnable = spawnable
+        self.args = args
+        self.kw = kw
+
+
+def stop(result=None):
+    """Return this from a handler to make the actor exit with result.
+    """
+    return _Stop(result)
+
+
+def promote(spawnable, *args, **kw):
+    """Return this from a handler to turn the actor into a greenlet
+    actor, which runs spawnable just like actor.spawn would. The
+    current state of the actor is passed as the first argument after
+    receive (or the first argument of main, for an Actor subclass),
+    followed by *args and **kw. The messages which have not been
+    handled yet are left in its mailbox.
+    """
+    return _Promote(spawnable, args, kw)
+
+
+def respond(message, response=None):
+    """Respond to a call message.
+    """
+    actor._respond(message, 'message', response)
+
+
+class CallbackActor(object):
+    """An actor which calls a handler for each message, instead of
+    running in a greenlet of its own. See the module documentation.
+    """
+    __slots__ = ('address', '_actor_id', '_handler', '_state', '_mailbox',
+                 '_scheduled', 'dead', '_alinks', '_exit_links',
+                 '_p_exit_event', '_trace_seq', 'messages_received',
+                 'messages_matched', 'mailbox_high_water', '__weakref__')
+
+    ## See Actor.codec.
+    codec = None
+
+    actor_id = property(lambda self: self._actor_id)
+
+    def __init__(self, handler, state):
+        self._handler = handler
+        self._state = state
+        self._mailbox = collections.deque()
+        self._scheduled = False
+        self.dead = False
+        self._alinks = self._exit_links = actor._NO_LINKS
+        self._p_exit_event = None
+        self._trace_seq = 0
+        self.messages_received = 0
+        self.messages_matched = 0
+        self.mailbox_high_water = 0
+        self.address = actor.Address(self)
+        self._actor_id = actor.unique_id()
+        actor.Actor.all_actors[self._actor_id] = self
+
+    @property
+    def _exit_event(self):
+        exit_event = self._p_exit_event
+        if exit_event is None:
+            exit_event = self._p_exit_event = event.AsyncResult()
+        return exit_event
+
+    def add_link(self, address, trap_exit=True):
+        """See Actor.add_link.
+        """
+        assert isinstance(address, actor.Address)
+        if self._alinks is actor._NO_LINKS:
+            self._alinks = []
+        self._alinks.append(address)
+        if trap_exit:
+            if self._exit_links is actor._NO_LINKS:
+                self._exit_links = []
+            self._exit_links.append(address)
+
+    def kill(self, exception=actor.Killed, block=False):
+        """Make the actor exit with exception, as if its handler had
+        raised it. Messages which have not been handled are dropped.
+        """
+        if self._handler is None:
+            return
+        try:
+            raise exception
+        except:
+            self._fail()
+
+    def metrics(self):
+        """See Actor.metrics. Callback actors do not do selective
+        receives, never wait and have no mailbox limit.
+        """
+        return {'mailbox': len(self._mailbox),
+                'mailbox_high_water': self.mailbox_high_water,
+                'messages_received': self.messages_received,
+                'messages_matched': self.messages_matched,
+                'dropped': 0,
+                'pattern_tests': 0,
+                'receive_wait': 0.0,
+                'calls_served': 0,
+                'hibernated': 0,
+                'hibernations': 0,
+                'reclaimed_bytes': 0}
+
+    #######
+    ## Implementation details
+    #######
+
+    def _cast(self, message, codec=None):
+        if codec is not None:
+            message = codec.decode(message)
+        self._mailbox.append(message)
+        if actor.METRICS:
+            self.messages_received += 1
+            if len(self._mailbox) > self.mailbox_high_water:
+                self.mailbox_high_water = len(self._mailbox)
+        if actor._tracer is not None:
+            self._trace_seq += 1
+            actor._tracer('deliver', time.time(), self._actor_id,
+                          actor._current_id(), self._trace_seq)
+        if not self._scheduled:
+            self._scheduled = True
+            _schedule(self)
+
+    def _run_batch(self):
+        """Handle up to BATCH messages. Return how many were handled.
+        """
+        mailbox = self._mailbox
+        handler = self._handler
+        handled = 0
+        actor._handling = self
+        try:
+            while mailbox and handled < BATCH:
+                message = mailbox.popleft()
+                handled += 1
+                if actor.METRICS:
+                    self.messages_matched += 1
+                if actor._tracer is not None:
+                    ## Messages are handled in order, so the number of
+                    ## this one follows from how many are left.
+                    actor._tracer('match', time.time(), self._actor_id, None,
+                                  self._trace_seq - len(mailbox))
+                state = handler(self._state, message)
+                if self._handler is None:
+                    ## The handler killed its own actor.
+                    break
+                if type(state) is _Stop:
+                    self._stop(state.result)
+                    break
+                elif type(state) is _Promote:
+                    self._promote(state)
+                    break
+                self._state = state
+        except:
+            self._fail()
+        finally:
+            actor._handling = None
+        return handled
+
+    def _stop(self, result):
+        self._exit_event.set(result)
+        self._exit(result)
+
+    def _fail(self):
+        if self._handler is None:
+            ## The handler killed its own actor, then raised.
+            return
+        exctype, excvalue, excinfo = sys.exc_info()
+        if actor.NOISY_ACTORS:
+            print "Callback actor had an exception:"
+            traceback.print_exc()
+        formatted = exc.format_exc()
+        self._exit_event.set_exception(excvalue)
+        self._exit(None, formatted)
+
+    def _exit(self, result, formatted=None):
+        ## Like a greenlet Actor, this one is not dead until its links
+        ## have been told, so that its Address can still be sent. It
+        ## has no handler from here on, so it only exits once.
+        self._handler = None
+        self._mailbox.clear()
+        try:
+            actor._exited(self, result, formatted)
+        finally:
+            self.dead = True
+
+    def _promote(self, promotion):
+        new = actor._instantiate(
+            promotion.spawnable, (self._state,) + promotion.args,
+            dict(promotion.kw))
+        ## The new Actor takes over the id, Address, links and exit
+        ## event of this one, and the messages not handled yet.
+        del actor.Actor.all_actors[new.actor_id]
+        new._actor_id = self._actor_id
+        actor.Actor.all_actors[self._actor_id] = new
+        new.address = self.address
+        self.address._rebind(new)
+        new._alinks = self._alinks
+        new._exit_links = self._exit_links
+        new._p_exit_event = self._p_exit_event
+        for message in self._mailbox:
+            new._mailbox.append(message)
+        self._mailbox.clear()
+        self.dead = True
+        actor._start(new, 0)
+
+
+def spawn(handler, state=None):
+    """Start a callback actor which handles messages with handler,
+    starting with state. Return its Address.
+    """
+    new = CallbackActor(handler, state)
+    if actor._tracer is not None:
+        actor._tracer('spawn', time.time(), new.actor_id,
+                      actor._current_id(), 0)
+    return new.address
+
+
+def spawn_link(handler, state=None):
+    """Just like spawn, but link the current Actor to the new one, as
+    actor.spawn_link does.
+    """
+    new = CallbackActor(handler, state)
+    new.add_link(actor.curaddr())
+    if actor._tracer is not None:
+        actor._tracer('spawn', time.time(), new.actor_id,
+                      actor._current_id(), 1)
+    return new.address
+
+
+def _schedule(callback_actor):
+    global _runner
+    _run_queue.append(callback_actor)
+    if _runner is None:
+        _runner = gevent.spawn(_run)
+
+
+def _run():
+    global _runner
+    try:
+        handled = 0
+        while _run_queue:
+            callback_actor = _run_queue.popleft()
+            again = False
+            try:
+                if not callback_actor.dead:
+                    handled += callback_actor._run_batch()
+                again = callback_actor._mailbox and not callback_actor.dead
+            except:
+                ## Exit hooks and links of one actor must not stop the
+                ## others from running.
+                traceback.print_exc()
+            finally:
+                if again:
+                    _run_queue.append(callback_actor)
+                else:
+                    callback_actor._scheduled = False
+            if handled >= YIELD_EVERY:
+                handled = 0
+                gevent.sleep(0)
+    finally:
+        _runner = None
@@ -0,0 +1,163 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+from pyact import actor
+from pyact import callback
+from pyact import groups
+
+
+def counter(state, message):
+    if message == 'stop':
+        return callback.stop(state)
+    if isinstance(message, dict) and 'reply' in message:
+        message['reply'] | state
+        return state
+    return state + message
+
+
+def server(state, message):
+    if message['method'] == 'add':
+        state += message['message']
+    callback.respond(message, state)
+    return state
+
+
+def crash(state, message):
+    raise RuntimeError(message)
+
+
+def promoted(receive, state, parent):
+    parent | {'state': state, 'address': actor.curaddr()}
+    pat, msg = receive('second')
+    return state, msg
+
+
+def promoting(state, message):
+    if message == 'promote':
+        return callback.promote(promoted, state['parent'])
+    return state
+
+
+class TestCallback(unittest.TestCase):
+    def test_cast_and_stop(self):
+        address = callback.spawn(counter, 0)
+        for i in range(1, 11):
+            address | i
+        address | 'stop'
+        self.assertEquals(address.wait(), 55)
+
+    def test_order_and_reply(self):
+        class Parent(actor.Actor):
+            def main(self):
+                addresses = [callback.spawn(counter, i) for i in range(100)]
+                for address in addresses:
+                    address | 1
+                    address | {'reply': self.address}
+                return [self.receive()[1] for address in addresses]
+
+        self.assertEquals(sorted(actor.spawn(Parent).wait()),
+                          range(1, 101))
+
+    def test_call(self):
+        class Caller(actor.Actor):
+            def main(self):
+                address = callback.spawn(server, 10)
+                return address.add(5), address.get()
+
+        self.assertEquals(actor.spawn(Caller).wait(), (15, 15))
+
+    def test_link_exception(self):
+        class Parent(actor.Actor):
+            def main(self):
+                address = callback.spawn_link(crash)
+                address | 'boom'
+                pat, msg = self.receive({'address': object,
+                                         'exception': object})
+                return msg['address'] is address
+
+        self.assertEquals(actor.spawn(Parent).wait(), True)
+
+    def test_kill(self):
+        class Parent(actor.Actor):
+            def main(self):
+                address = callback.spawn_link(counter, 0)
+                address | 1
+                address.kill()
+                pat, msg = self.receive({'address': object,
+                                         'exception': object})
+                try:
+                    address | 1
+                except actor.DeadActor:
+                    return msg['exception']['text-exception']
+
+        self.assertEquals(actor.spawn(Parent).wait(), 'Killed\n')
+
+    def test_kill_self(self):
+        """Assert that a handler which kills its own actor and then
+        stops or raises does not keep other callback actors from
+        running.
+        """
+        def suicidal(state, message):
+            actor.curaddr().kill()
+            if message == 'raise':
+                raise RuntimeError(message)
+            return callback.stop(message)
+
+        class Parent(actor.Actor):
+            def main(self):
+                got = []
+                for message in ('stop', 'raise'):
+                    doomed = callback.spawn(suicidal)
+                    doomed | message
+                    other = callback.spawn(counter, 0)
+                    other | 1
+                    other | {'reply': self.address}
+                    got.append(self.receive(int, timeout=1)[1])
+                return got
+
+        self.assertEquals(actor.spawn(Parent).wait(), [1, 1])
+
+    def test_promote(self):
+        class Parent(actor.Actor):
+            def main(self):
+                address = callback.spawn(
+                    promoting, {'parent': self.address})
+                groups.join('test_promote', address)
+                address | 'first'
+                address | 'promote'
+                pat, msg = self.receive()
+                same = (msg['address'] is address and
+                        groups.members('test_promote') == [address])
+                address | 'second'
+                return same, address.wait()
+
+        same, (state, message) = actor.spawn(Parent).wait()
+        self.assertEquals(same, True)
+        self.assertEquals(message, 'second')
+        self.assertEquals(groups.members('test_promote'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Message codecs.
+
+A codec turns a message into a payload when it is cast, and the
+payload back into a message when it is put in the receiving Actor's
+mailbox.  Codecs are registered by name:
+
+ * json: the default; messages are sent as JSON text.
+ * copy: no encoding at all, the message is copied structurally.
+ * marshal: a compact binary encoding built on the marshal module.
+ * pickle: pickle, which can send any picklable object.  Only use
+   it between actors that trust each other.
+
+The codec is picked per cast, per receiving actor (Actor.codec) or
+for the whole process with set_default, in that order.
+"""
+
+import cPickle
+import cStringIO
+import marshal
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class Codec(object):
+    """Base class for codecs.
+    """
+    name = None
+
+    ## Whether the same payload may be decoded by several receivers,
+    ## which lets multicast encode a message only once.
+    reusable = True
+
+    def encode(self, message):
+        """Return the payload for message.
+        """
+        raise NotImplementedError("Implement in subclass.")
+
+    def decode(self, payload):
+        """Return the message encoded in payload.
+        """
+        raise NotImplementedError("Implement in subclass.")
+
+
+_codecs = {}
+_default = 'json'
+
+
+def register(codec):
+    """Register codec under its name, replacing any previous codec
+    with the same name.
+    """
+    _codecs[codec.name] = codec
+
+
+def lookup(name=None):
+    """Return the codec registered under name, or the default codec
+    if name is None.  Raise LookupError if there is no such codec.
+    """
+    if name is None:
+        name = _default
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise LookupError("unknown codec: %r" % (name,))
+
+
+def set_default(name):
+    """Use the codec registered under name when neither the cast nor
+    the receiving actor picks one.
+    """
+    global _default
+    lookup(name)
+    _default = name
+
+
+## Types that the binary codecs encode natively, by type. Each entry
+## is a (code, to_payload, from_payload) tuple.
+_extensions = {}
+_extension_codes = {}
+
+
+def register_extension(type_, code, to_payload, from_payload):
+    """Teach the binary codecs to encode instances of type_.
+
+    to_payload turns an instance into a simple value (a string, say)
+    and from_payload turns it back. code is a small integer which
+    identifies type_ in encoded messages.
+    """
+    _extensions[type_] = (code, to_payload, from_payload)
+    _extension_codes[code] = from_payload
+
+
+class JSONCodec(Codec):
+    """Encode messages as JSON. default and object_hook are passed on
+    to json.dumps and json.loads.
+    """
+    name = 'json'
+
+    def __init__(self, default=None, object_hook=None):
+        self.default = default
+        self.object_hook = object_hook
+
+    def encode(self, message):
+        return json.dumps(message, default=self.default)
+
+    def decode(self, payload):
+        return json.loads(payload, object_hook=self.object_hook)
+
+
+class CopyCodec(Codec):
+    """Do not encode messages at all; hand the receiver a copy made by
+    copier instead.  Only works within a process.
+    """
+    name = 'copy'
+    reusable = False
+
+    def __init__(self, copier):
+        self.copier = copier
+
+    def encode(self, message):
+        return self.copier(message)
+
+    def decode(self, payload):
+        return payload
+
+
+## Encoded extension objects are stored as (Ellipsis, code, payload).
+## Ellipsis is not a valid message value, so it can not be mistaken
+## for a tuple in the message itself.
+def _pack(obj):
+    obj_type = type(obj)
+    if obj_type is dict:
+        return dict([(_pack(key), _pack(value))
+                     for key, value in obj.iteritems()])
+    elif obj_type is list:
+        return [_pack(item) for item in obj]
+    elif obj_type in (tuple, set, frozenset):
+        return obj_type([_pack(item) for item in obj])
+    elif obj_type in _extensions:
+        code, to_payload, from_payload = _extensions[obj_type]
+        return (Ellipsis, code, to_payload(obj))
+    return obj
+
+
+def _unpack(obj):
+    obj_type = type(obj)
+    if obj_type is dict:
+        return dict([(_unpack(key), _unpack(value))
+                     for key, value in obj.iteritems()])
+    elif obj_type is list:
+        return [_unpack(item) for item in obj]
+    elif obj_type is tuple:
+        if len(obj) == 3 and obj[0] is Ellipsis:
+            return _extension_codes[obj[1]](obj[2])
+        return tuple([_unpack(item) for item in obj])
+    elif obj_type in (set, frozenset):
+        return obj_type([_unpack(item) for item in obj])
+    return obj
+
+
+class MarshalCodec(Codec):
+    """A compact binary encoding built on marshal.
+
+    Messages without extension objects are marshalled as they are.
+    Otherwise the extension objects are replaced with tagged tuples
+    first, and a flag in the first byte of the payload tells decode
+    to put them back.
+    """
+    name = 'marshal'
+
+    def encode(self, message):
+        try:
+            return '\x00' + marshal.dumps(message, 2)
+        except ValueError:
+            return '\x01' + marshal.dumps(_pack(message), 2)
+
+    def decode(self, payload):
+        message = marshal.loads(payload[1:])
+        if payload[0] == '\x01':
+            message = _unpack(message)
+        return message
+
+
+def _persistent_id(obj):
+    extension = _extensions.get(type(obj))
+    if extension is None:
+        return None
+    code, to_payload, from_payload = extension
+    return (code, to_payload(obj))
+
+
+def _persistent_load(pid):
+    code, payload = pid
+    return _extension_codes[code](payload)
+
+
+class PickleCodec(Codec):
+    """Encode messages with pickle.  Decoding a pickle can run
+    arbitrary code, so only use this codec between trusted actors.
+    """
+    name = 'pickle'
+
+    def encode(self, message):
+        pickler = cPickle.Pickler(cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = _persistent_id
+        pickler.dump(message)
+        return pickler.getvalue()
+
+    def decode(self, payload):
+        unpickler = cPickle.Unpickler(cStringIO.StringIO(payload))
+        unpickler.persistent_load = _persistent_load
+        return unpickler.load()
+
+
+register(MarshalCodec())
+register(PickleCodec())
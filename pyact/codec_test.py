@@ -0,0 +1,108 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+from pyact import actor
+from pyact import codec
+
+
+MESSAGE = {'text': 'hello', 'items': [1, 2.5, None, True],
+           'pos': (1, 2), 'data': actor.Binary('\x00\xff')}
+
+
+class TestCodec(unittest.TestCase):
+    def roundtrip(self, name, message):
+        c = codec.lookup(name)
+        return c.decode(c.encode(message))
+
+    def test_lookup(self):
+        self.assertEquals(codec.lookup().name, 'json')
+        self.assertEquals(codec.lookup('marshal').name, 'marshal')
+        self.assertRaises(LookupError, codec.lookup, 'nonexistent')
+        self.assertRaises(LookupError, codec.set_default, 'nonexistent')
+
+    def test_roundtrip(self):
+        for name in ('copy', 'marshal', 'pickle'):
+            self.assertEquals(self.roundtrip(name, MESSAGE), MESSAGE)
+
+    def test_binary_is_not_base64(self):
+        data = actor.Binary('\xff' * 300)
+        for name in ('marshal', 'pickle'):
+            self.assertTrue(len(codec.lookup(name).encode(data)) < 350)
+
+    def test_ellipsis_tuple(self):
+        message = {'data': actor.Binary('x'), 'tuple': ('a', 1, 2)}
+        self.assertEquals(self.roundtrip('marshal', message), message)
+
+    def test_address(self):
+        class Echo(actor.Actor):
+            def main(self):
+                pat, msg = self.receive({'reply': actor.Address})
+                msg['reply'] | msg
+
+        class Sender(actor.Actor):
+            def main(self, name):
+                echo = actor.spawn(Echo)
+                echo.cast({'reply': self.address}, codec=name)
+                pat, msg = self.receive()
+                return msg['reply'] == self.address
+
+        for name in ('json', 'copy', 'marshal', 'pickle'):
+            self.assertEquals(actor.spawn(Sender, name).wait(), True)
+
+    def test_actor_codec(self):
+        class Receiver(actor.Actor):
+            codec = 'marshal'
+            def main(self):
+                pat, msg = self.receive()
+                return msg
+
+        class Sender(actor.Actor):
+            def main(self):
+                receiver = actor.spawn(Receiver)
+                receiver | ('tuple', 'survives')
+                return receiver.wait()
+
+        self.assertEquals(actor.spawn(Sender).wait(), ('tuple', 'survives'))
+
+    def test_set_default(self):
+        def receiver(receive):
+            pat, msg = receive()
+            return msg
+
+        def sender(receive):
+            address = actor.spawn(receiver)
+            address | (1, 2)
+            return address.wait()
+
+        codec.set_default('copy')
+        try:
+            self.assertEquals(actor.spawn(sender).wait(), (1, 2))
+        finally:
+            codec.set_default('json')
+        self.assertEquals(actor.spawn(sender).wait(), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
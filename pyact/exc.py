@@ -81,7 +81,10 @@ def format_exc(exc=None):
 
         # "self"
         for name, var in local_vars:
-            if name == 'self' and hasattr(var, '__dict__'):
+            ## Objects with __slots__ have no __dict__, and Address
+            ## makes up a method for any attribute it does not have.
+            if name == 'self' and isinstance(
+                    getattr(var, '__dict__', None), dict):
                 vars_dict['self'] = dict([
                     (key, value) for (key, value) in var.__dict__.items()
                     if re.search(
@@ -0,0 +1,116 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Process groups.
+
+A group is a named set of actors that messages can be published to,
+much like pg in Erlang:
+
+    groups.join('prices')
+    ...
+    groups.publish('prices', {'symbol': 'ERIC', 'price': 71.5})
+
+An actor leaves all of its groups automatically when it exits.
+"""
+
+from pyact import actor
+
+
+## Group name to the set of Addresses of its members. Members are kept
+## by Address, which stays the same when a callback Actor is promoted.
+_groups = {}
+
+## Member Address to the set of names of the groups it is in.
+_memberships = {}
+
+
+def _member(address):
+    if address is None:
+        return actor.curaddr()
+    ## Raise DeadActor for Actors which are no longer running.
+    address._actor
+    return address
+
+
+def join(name, address=None):
+    """Add the Actor at address to the named group. If address is not
+    given, add the current Actor. Joining a group more than once has
+    no effect.
+    """
+    member = _member(address)
+    _groups.setdefault(name, set()).add(member)
+    _memberships.setdefault(member, set()).add(name)
+
+
+def leave(name, address=None):
+    """Remove the Actor at address, or the current Actor, from the
+    named group.
+    """
+    member = _member(address)
+    _remove(name, member)
+    names = _memberships.get(member)
+    if names is not None:
+        names.discard(name)
+        if not names:
+            del _memberships[member]
+
+
+def _remove(name, member):
+    members = _groups.get(name)
+    if members is not None:
+        members.discard(member)
+        if not members:
+            del _groups[name]
+
+
+def members(name):
+    """Return the Addresses of all Actors in the named group.
+    """
+    return list(_groups.get(name, ()))
+
+
+def names():
+    """Return the names of all groups which have members.
+    """
+    return _groups.keys()
+
+
+def publish(name, message, codec=None):
+    """Cast message to every member of the named group. The message is
+    only encoded once; see actor.multicast.
+
+    Return the number of Actors the message was delivered to.
+    """
+    members = _groups.get(name)
+    if not members:
+        return 0
+    return actor.multicast(list(members), message, codec)
+
+
+def _actor_exited(exited):
+    member = exited.address
+    for name in _memberships.pop(member, ()):
+        _remove(name, member)
+
+
+actor.add_exit_hook(_actor_exited)
@@ -0,0 +1,84 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+from pyact import actor
+from pyact import groups
+
+
+def subscriber(receive, name, parent):
+    groups.join(name)
+    parent | 'joined'
+    pat, msg = receive()
+    msg['reply'] | msg['text']
+
+
+class TestGroups(unittest.TestCase):
+    def test_publish(self):
+        class Publisher(actor.Actor):
+            def main(self):
+                actor.spawn(subscriber, 'test_publish', self.address)
+                actor.spawn(subscriber, 'test_publish', self.address)
+                self.receive('joined')
+                self.receive('joined')
+                count = len(groups.members('test_publish'))
+                delivered = groups.publish(
+                    'test_publish', {'text': 'hello', 'reply': self.address})
+                return count, delivered, self.receive()[1], self.receive()[1]
+
+        self.assertEquals(actor.spawn(Publisher).wait(),
+                          (2, 2, 'hello', 'hello'))
+
+    def test_exit_leaves(self):
+        class Publisher(actor.Actor):
+            def main(self):
+                actor.spawn(subscriber, 'test_exit_leaves', self.address)
+                self.receive('joined')
+                groups.join('test_exit_leaves')
+                groups.publish('test_exit_leaves',
+                               {'text': 'bye', 'reply': self.address})
+                self.receive('bye')
+                self.sleep(0.01)
+                return groups.members('test_exit_leaves')
+
+        self.assertEquals(len(actor.spawn(Publisher).wait()), 1)
+        self.assertEquals(groups.members('test_exit_leaves'), [])
+        self.assertFalse('test_exit_leaves' in groups.names())
+
+    def test_leave(self):
+        class Member(actor.Actor):
+            def main(self):
+                groups.join('test_leave')
+                groups.join('test_leave')
+                groups.join('test_leave_other')
+                groups.leave('test_leave')
+                return (groups.publish('test_leave', 'x'),
+                        groups.publish('test_leave_other', 'x'))
+
+        self.assertEquals(actor.spawn(Member).wait(), (0, 1))
+        self.assertEquals(groups.members('test_leave_other'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
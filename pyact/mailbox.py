@@ -0,0 +1,178 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+from pyact import shape
+
+
+## Placeholder for a message that has been taken out of the mailbox.
+_REMOVED = object()
+
+## Do not bother compacting until there are at least this many
+## removed slots in the mailbox.
+COMPACT_THRESHOLD = 64
+
+
+class Mailbox(object):
+    """The mailbox of an Actor.
+
+    Messages are kept in arrival order in a list.  Taking a message
+    out of the mailbox does not move the messages after it; its slot
+    is replaced with a placeholder instead, and the list is compacted
+    once more than half of it consists of placeholders.  This makes
+    appending, taking the first message and taking a message found
+    by a selective receive scan all O(1) amortized.
+
+    The mailbox also remembers the patterns of the last scan and how
+    far into the mailbox that scan got.  The messages before that
+    position are known not to match these patterns, so a scan with
+    the same patterns only has to test messages that arrived after
+    it.
+
+    tests counts how many times scan has tested a message against a
+    pattern.
+    """
+    __slots__ = ('_items', '_head', '_count', '_scan_key', '_scan_index',
+                 'tests')
+
+    def __init__(self):
+        self._items = []
+        self._head = 0
+        self._count = 0
+        self._scan_key = None
+        self._scan_index = 0
+        self.tests = 0
+
+    def __len__(self):
+        return self._count
+
+    def __nonzero__(self):
+        return self._count != 0
+
+    def __iter__(self):
+        items = self._items
+        for i in xrange(self._head, len(items)):
+            message = items[i]
+            if message is not _REMOVED:
+                yield message
+
+    def append(self, message):
+        """Add message to the end of the mailbox.
+        """
+        self._items.append(message)
+        self._count += 1
+
+    def popleft(self):
+        """Remove and return the first message in the mailbox.
+
+        Raise IndexError if the mailbox is empty.
+        """
+        if not self._count:
+            raise IndexError('pop from an empty mailbox')
+        items = self._items
+        head = self._head
+        while items[head] is _REMOVED:
+            head += 1
+        message = items[head]
+        self._head = head
+        self._remove(head)
+        return message
+
+    def scan(self, patterns):
+        """Find the first message which matches any of the given
+        patterns, remove it from the mailbox and return it along
+        with the pattern it matched.  If no message matches, return
+        None, None.
+
+        For each message, the patterns are tried in the order they
+        are given.
+        """
+        matchers = [(pattern, shape.compile(pattern))
+                    for pattern in patterns]
+        scan_key = tuple([match for pattern, match in matchers])
+        if scan_key == self._scan_key:
+            start = max(self._scan_index, self._head)
+        else:
+            start = self._head
+            self._scan_key = scan_key
+        items = self._items
+        examined = 0
+        for i in xrange(start, len(items)):
+            message = items[i]
+            if message is _REMOVED:
+                continue
+            examined += 1
+            for tried, (pattern, match) in enumerate(matchers):
+                if match(message):
+                    self.tests += (examined - 1) * len(matchers) + tried + 1
+                    self._scan_index = i
+                    self._remove(i)
+                    return pattern, message
+        self.tests += examined * len(matchers)
+        self._scan_index = len(items)
+        return None, None
+
+    def clear(self):
+        """Remove all messages from the mailbox.
+        """
+        self.__init__()
+
+    def shrink(self):
+        """Release the storage of removed and spare slots. Return the
+        number of bytes released.
+        """
+        before = sys.getsizeof(self._items)
+        self._compact()
+        ## A slice is allocated with no room to spare.
+        self._items = self._items[:]
+        return max(before - sys.getsizeof(self._items), 0)
+
+    def _remove(self, index):
+        items = self._items
+        items[index] = _REMOVED
+        self._count -= 1
+        if index == self._head:
+            self._head += 1
+        removed = len(items) - self._count
+        if removed > COMPACT_THRESHOLD and removed > self._count:
+            self._compact()
+
+    def _compact(self):
+        """Drop all removed slots, keeping the scan position at the
+        same message.
+        """
+        items = []
+        scan_index = self._scan_index
+        for i in xrange(self._head, len(self._items)):
+            if i == self._scan_index:
+                scan_index = len(items)
+            message = self._items[i]
+            if message is not _REMOVED:
+                items.append(message)
+        if self._scan_index >= len(self._items):
+            scan_index = len(items)
+        elif self._scan_index < self._head:
+            scan_index = 0
+        self._items = items
+        self._head = 0
+        self._scan_index = scan_index
@@ -0,0 +1,126 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+import unittest
+
+from pyact import mailbox
+
+
+class TestMailbox(unittest.TestCase):
+    def test_append_popleft(self):
+        box = mailbox.Mailbox()
+        self.assertEquals(bool(box), False)
+        box.append(1)
+        box.append(2)
+        self.assertEquals(len(box), 2)
+        self.assertEquals(box.popleft(), 1)
+        self.assertEquals(box.popleft(), 2)
+        self.assertEquals(bool(box), False)
+        self.assertRaises(IndexError, box.popleft)
+
+    def test_scan(self):
+        box = mailbox.Mailbox()
+        for message in ['a', 1, 'b', 2]:
+            box.append(message)
+        self.assertEquals(box.scan([int]), (int, 1))
+        self.assertEquals(box.scan([float]), (None, None))
+        self.assertEquals(box.scan([str, int]), (str, 'a'))
+        self.assertEquals(list(box), ['b', 2])
+        self.assertEquals(box.popleft(), 'b')
+        self.assertEquals(box.scan([str, int]), (int, 2))
+        self.assertEquals(len(box), 0)
+
+    def test_scan_resumes(self):
+        box = mailbox.Mailbox()
+        for i in range(10):
+            box.append('junk')
+        self.assertEquals(box.scan([int]), (None, None))
+        box.append(1)
+        self.assertEquals(box.scan([int]), (int, 1))
+        box.popleft()
+        box.append(2)
+        self.assertEquals(box.scan([int]), (int, 2))
+        self.assertEquals(len(box), 9)
+
+    def test_tests(self):
+        box = mailbox.Mailbox()
+        for message in ['a', 'b', 1]:
+            box.append(message)
+        box.scan([float, int])
+        self.assertEquals(box.tests, 6)
+        box.scan([float])
+        self.assertEquals(box.tests, 8)
+        ## The matching pattern is counted at its own position.
+        box.append(2)
+        box.scan([{'a': int}, {'a': int}, int])
+        self.assertEquals(box.tests, 17)
+
+    def test_shrink(self):
+        box = mailbox.Mailbox()
+        for i in range(1000):
+            box.append(i)
+        for i in range(990):
+            box.popleft()
+        box.scan([str])
+        self.assert_(box.shrink() > 0)
+        self.assertEquals(list(box), range(990, 1000))
+        box.append('a')
+        self.assertEquals(box.scan([str]), (str, 'a'))
+        self.assert_(box.shrink() > 0)
+        self.assertEquals(box.shrink(), 0)
+
+    def test_compaction(self):
+        """Compare against a plain list while removing enough messages
+        to trigger compaction many times.
+        """
+        rand = random.Random(0)
+        box = mailbox.Mailbox()
+        reference = []
+        patterns = [[int], [str], [int, str], [float]]
+        for step in range(5000):
+            op = rand.random()
+            if op < 0.5:
+                message = rand.choice([1, 'a', 2.0])
+                box.append(message)
+                reference.append(message)
+            elif op < 0.6:
+                if reference:
+                    self.assertEquals(box.popleft(), reference.pop(0))
+            else:
+                pats = rand.choice(patterns)
+                expected = None, None
+                for i, message in enumerate(reference):
+                    for pat in pats:
+                        if isinstance(message, pat):
+                            expected = pat, message
+                            break
+                    if expected[0] is not None:
+                        del reference[i]
+                        break
+                self.assertEquals(box.scan(pats), expected)
+            self.assertEquals(len(box), len(reference))
+        self.assertEquals(list(box), reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Runtime metrics of actors.
+
+Every Actor keeps a few cheap counters, see Actor.metrics. This
+module collects them from all running Actors:
+
+    snap = metrics.snapshot()
+    print snap['totals']['messages_received']
+    for actor_id, depth in metrics.top('mailbox', snap):
+        print actor_id, depth
+
+Counters are kept while pyact.actor.METRICS is true; use enable and
+disable to switch. Actors which have exited are not included.
+"""
+
+from pyact import actor
+
+
+## Totals of these counters are their maximum, not their sum.
+_MAXIMUM = frozenset(['mailbox_high_water'])
+
+
+def enable():
+    """Start keeping counters.
+    """
+    actor.METRICS = True
+
+
+def disable():
+    """Stop keeping counters. Counters kept so far are left as they are.
+    """
+    actor.METRICS = False
+
+
+def snapshot():
+    """Return the metrics of all running Actors, as a dict with:
+
+     * actors: the number of running Actors.
+     * per_actor: a dict which maps actor ids to Actor.metrics().
+     * totals: the counters summed over all Actors, except for
+       mailbox_high_water which is the highest of them.
+    """
+    per_actor = {}
+    totals = {}
+    for actor_id, running in actor.Actor.all_actors.items():
+        counters = per_actor[actor_id] = running.metrics()
+        for key, value in counters.iteritems():
+            if key in _MAXIMUM:
+                totals[key] = max(totals.get(key, 0), value)
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return {'actors': len(per_actor), 'per_actor': per_actor,
+            'totals': totals}
+
+
+def top(key, snap=None, count=10):
+    """Return the (actor id, value) pairs of the count Actors with the
+    highest value of the counter key, highest first. If snap is not
+    given, take a new snapshot.
+    """
+    if snap is None:
+        snap = snapshot()
+    ranked = sorted(snap['per_actor'].iteritems(),
+                    key=lambda (actor_id, counters): counters[key],
+                    reverse=True)
+    return [(actor_id, counters[key]) for actor_id, counters in ranked[:count]]
@@ -0,0 +1,98 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import metrics
+
+
+class Echo(actor.Server):
+    def echo(self, message):
+        return message
+
+
+def picky(receive, parent):
+    parent | 'ready'
+    receive(int)
+    parent | 'done'
+    receive('stop')
+
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.enable()
+
+    def test_counters(self):
+        class Parent(actor.Actor):
+            def main(self):
+                child = actor.spawn(picky, self.address)
+                self.receive('ready')
+                for message in ['a', 'b', 1]:
+                    child | message
+                self.receive('done')
+                server = Echo.spawn()
+                server.echo(1)
+                server.echo(2)
+                snap = metrics.snapshot()
+                child | 'stop'
+                server.kill()
+                return (snap, child.actor_id, server.actor_id,
+                        metrics.top('mailbox', snap, 1))
+
+        snap, child, server, top = actor.spawn(Parent).wait()
+        counters = snap['per_actor'][child]
+        self.assertEquals(counters['messages_received'], 3)
+        self.assertEquals(counters['messages_matched'], 1)
+        self.assertEquals(counters['mailbox'], 2)
+        self.assertEquals(counters['mailbox_high_water'], 3)
+        ## 'a', 'b' and 1 against int, then 'a' and 'b' against 'stop'.
+        self.assertEquals(counters['pattern_tests'], 5)
+        self.assertTrue(counters['receive_wait'] > 0)
+        self.assertEquals(snap['per_actor'][server]['calls_served'], 2)
+        self.assertEquals(top, [(child, 2)])
+        self.assertTrue(snap['totals']['messages_received'] >= 5)
+        self.assertEquals(snap['actors'], len(snap['per_actor']))
+
+    def test_disable(self):
+        metrics.disable()
+        def child(receive):
+            receive()
+            return gevent.getcurrent().metrics()
+
+        class Parent(actor.Actor):
+            def main(self):
+                address = actor.spawn(child)
+                address | 'hello'
+                return address.wait()
+
+        counters = actor.spawn(Parent).wait()
+        self.assertEquals(counters['messages_received'], 0)
+        self.assertEquals(counters['messages_matched'], 0)
+        self.assertEquals(counters['receive_wait'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
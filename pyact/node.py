@@ -0,0 +1,455 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Messaging between processes.
+
+A Node listens on a TCP port and connects to other nodes on demand.
+The name of a node is the host other nodes reach it at and the port
+it listens on, like "127.0.0.1:4000".  Once a node is running,
+Addresses in messages that are sent to other nodes carry the name of
+the node, and come out as RemoteAddress objects on the other side,
+which can be used much like a local Address:
+
+    node = Node('0.0.0.0', 4000, advertised_host='10.0.0.1')
+    node.start()
+    server = node.address('10.0.0.2:4000', 'some-server')
+    server.call('lookup', 'key')
+
+Each node keeps one persistent connection to every node it sends
+messages to, and messages travel as length-prefixed JSON frames.
+Frames are not written one by one; they are buffered per destination
+and written in batches, when the buffer grows past max_batch_bytes or
+at the end of the current hub tick (or after flush_interval seconds,
+if it is set).
+Messages to actors that do not exist are dropped, as they are in
+Erlang, except for calls: the caller gets a RemoteException for the
+DeadActor, just like a local call raises DeadActor.
+"""
+
+import collections
+import struct
+import traceback
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from gevent import event
+import gevent
+import gevent.queue
+import gevent.server
+import gevent.socket
+
+from pyact import actor
+from pyact import codec
+from pyact import exc
+
+
+## A batch is a header with the size of the batch in bytes and the
+## number of frames in it, followed by the frames. Each frame is its
+## size followed by a JSON object.
+_BATCH_HEADER = struct.Struct('>II')
+_FRAME_HEADER = struct.Struct('>I')
+
+## Running nodes of this process by name.
+_nodes = {}
+
+## Hosts which listen on every interface, and so cannot be used by
+## other nodes to reach this one.
+_WILDCARD_HOSTS = ('', '0.0.0.0', '::')
+
+
+class RemoteAddress(actor.Address):
+    """The Address of an Actor on another node.
+    """
+    __slots__ = ('_node', 'node_name', '_actor_id')
+
+    local = False
+
+    def __init__(self, node, node_name, actor_id):
+        self._node = node
+        self.node_name = node_name
+        self._actor_id = actor_id
+
+    def to_json(self):
+        return {'_pyact_address': self._actor_id,
+                '_pyact_node': self.node_name}
+
+    @property
+    def _actor(self):
+        raise actor.ActorError(
+            "actor %s is on node %s" % (self._actor_id, self.node_name))
+
+    @property
+    def actor_id(self):
+        return self._actor_id
+
+    def link(self, trap_exit=True):
+        """Link the current Actor to the remote Actor at this address.
+        """
+        self._node._send(self.node_name, {
+                'op': 'link', 'to': self._actor_id,
+                'address': actor.curaddr(),
+                'trap_exit': trap_exit})
+
+    def cast(self, message, codec=None):
+        """Send a message to the remote Actor this object addresses.
+        Messages between nodes are always sent as JSON, so codec is
+        ignored.
+        """
+        if hasattr(message,'_as_json_obj'):
+            message = message._as_json_obj()
+        self._node._send(self.node_name, {
+                'op': 'cast', 'to': self._actor_id, 'message': message})
+
+    def wait(self):
+        """Wait for the remote Actor to finish, and return its result.
+        If it raised an exception, raise RemoteException.
+        """
+        return self._node._wait(self.node_name, self._actor_id)
+
+    def kill(self):
+        """Kill the remote Actor.
+        """
+        self._node._send(self.node_name, {
+                'op': 'kill', 'to': self._actor_id})
+
+    def __eq__(self, other):
+        return (isinstance(other, RemoteAddress) and
+                self.node_name == other.node_name and
+                self._actor_id == other._actor_id)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.node_name, self._actor_id))
+
+    def __repr__(self):
+        return '<RemoteAddress %s on %s>' % (self._actor_id, self.node_name)
+
+
+class _Peer(object):
+    """The connection to another node. Frames are buffered until the
+    peer is flushed, and batches are written by a greenlet of its own,
+    so sending never blocks the sender.
+    """
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+        self.buffer = []
+        self.buffered = 0
+        self.scheduled = False
+        self.queue = gevent.queue.Queue()
+        self.writer = gevent.spawn(self._run)
+
+    def send(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.node.max_batch_bytes:
+            self.flush('size')
+        elif not self.scheduled:
+            self.scheduled = True
+            loop = gevent.get_hub().loop
+            if self.node.flush_interval is None:
+                loop.run_callback(self._scheduled_flush, 'tick')
+            else:
+                loop.timer(self.node.flush_interval).start(
+                    self._scheduled_flush, 'timer')
+
+    def flush(self, reason):
+        """Hand the buffered frames to the writer as one batch.
+        """
+        frames = self.buffer
+        if not frames:
+            return
+        self.buffer = []
+        self.buffered = 0
+        self.node._count_batch(len(frames), reason)
+        data = ''.join(frames)
+        self.queue.put(_BATCH_HEADER.pack(len(data), len(frames)) + data)
+
+    def close(self):
+        self.writer.kill()
+
+    def _scheduled_flush(self, reason):
+        ## Runs in the hub. A size flush may have emptied the buffer
+        ## since, in which case there is nothing to do.
+        self.scheduled = False
+        self.flush(reason)
+
+    def _run(self):
+        host, port = self.name.rsplit(':', 1)
+        sock = None
+        try:
+            sock = gevent.socket.create_connection((host, int(port)))
+            while True:
+                data = self.queue.get()
+                sock.sendall(data)
+                self.node.counters['bytes_sent'] += len(data)
+        except Exception:
+            if actor.NOISY_ACTORS:
+                print "Connection to node %s failed:" % (self.name,)
+                traceback.print_exc()
+        finally:
+            if sock is not None:
+                sock.close()
+            ## Queued frames are lost; the next send reconnects.
+            if self.node._peers.get(self.name) is self:
+                del self.node._peers[self.name]
+
+
+class Node(object):
+    """A node of actors, reachable from other nodes over TCP.
+    """
+    ## Flush the frames buffered for a peer once there are this many
+    ## bytes of them.
+    max_batch_bytes = 64 * 1024
+
+    ## If not None, flush buffered frames this many seconds after the
+    ## first of them was sent, rather than at the end of the hub tick.
+    ## Gives bigger batches at the cost of latency.
+    flush_interval = None
+
+    def __init__(self, host='127.0.0.1', port=0, advertised_host=None):
+        """Listen on host and port. Other nodes reach this one at
+        advertised_host, which defaults to host and must be given if
+        host is a wildcard address such as '0.0.0.0'.
+        """
+        if advertised_host is None:
+            if host in _WILDCARD_HOSTS:
+                raise ValueError(
+                    "a node listening on %r needs an advertised_host" %
+                    (host,))
+            advertised_host = host
+        self.host = host
+        self.port = port
+        self.advertised_host = advertised_host
+        self.name = None
+        self._server = None
+        self._peers = {}
+        self._waits = {}
+        self.counters = collections.defaultdict(int)
+        self.batch_sizes = collections.defaultdict(int)
+
+    def start(self):
+        """Start listening for connections from other nodes. If port
+        was 0, a free port is picked. Afterwards, name is set.
+        """
+        self._server = gevent.server.StreamServer(
+            (self.host, self.port), self._serve)
+        self._server.start()
+        self.port = self._server.address[1]
+        self.name = '%s:%d' % (self.advertised_host, self.port)
+        _nodes[self.name] = self
+        actor._remote_address_factory = _remote_address
+
+    def stop(self):
+        """Stop listening and close all connections to other nodes.
+        """
+        self._server.stop()
+        for peer in self._peers.values():
+            peer.close()
+        self._peers.clear()
+        del _nodes[self.name]
+        if not _nodes:
+            actor._remote_address_factory = None
+
+    def address(self, node_name, actor_id):
+        """Return the Address of the Actor with actor_id on the named
+        node, which may be this node.
+        """
+        if node_name == self.name:
+            return actor.Address.lookup(actor_id)
+        return RemoteAddress(self, node_name, actor_id)
+
+    def flush(self):
+        """Hand all buffered frames to the writers right away.
+        """
+        for peer in self._peers.values():
+            peer.flush('explicit')
+
+    def stats(self):
+        """Return the transport counters of this node:
+
+         * batches_sent, frames_sent, bytes_sent, batches_received
+           and frames_received.
+         * flush_<reason>: the number of batches flushed because the
+           buffer was full (size), at the end of a hub tick (tick),
+           when flush_interval ran out (timer) or by flush (explicit).
+         * batch_sizes: a dict which maps a power of two to the number
+           of batches with at most that many frames, and more than
+           half as many.
+        """
+        stats = dict(self.counters)
+        stats['batch_sizes'] = dict(self.batch_sizes)
+        return stats
+
+    #######
+    ## Implementation details
+    #######
+
+    def _send(self, node_name, frame):
+        data = json.dumps(frame, default=self._default)
+        peer = self._peers.get(node_name)
+        if peer is None:
+            peer = self._peers[node_name] = _Peer(self, node_name)
+        peer.send(_FRAME_HEADER.pack(len(data)) + data)
+
+    def _count_batch(self, frames, reason):
+        self.counters['batches_sent'] += 1
+        self.counters['frames_sent'] += frames
+        self.counters['flush_' + reason] += 1
+        bucket = 1
+        while bucket < frames:
+            bucket <<= 1
+        self.batch_sizes[bucket] += 1
+
+    def _default(self, obj):
+        if isinstance(obj, actor.Address) and obj.local:
+            return {'_pyact_address': obj.actor_id,
+                    '_pyact_node': self.name}
+        return actor.handle_custom(obj)
+
+    def _object_hook(self, obj):
+        if len(obj) == 2 and '_pyact_node' in obj and '_pyact_address' in obj:
+            return self.address(obj['_pyact_node'], obj['_pyact_address'])
+        return actor.generate_custom(obj)
+
+    def _serve(self, sock, address):
+        stream = sock.makefile('rb')
+        try:
+            while True:
+                header = stream.read(_BATCH_HEADER.size)
+                if len(header) < _BATCH_HEADER.size:
+                    break
+                size, count = _BATCH_HEADER.unpack(header)
+                data = stream.read(size)
+                if len(data) < size:
+                    break
+                self._dispatch_batch(data, count)
+        finally:
+            stream.close()
+            sock.close()
+
+    def _dispatch_batch(self, data, count):
+        ## Frames are handled in order without yielding, so an Actor
+        ## which gets several messages from the batch is woken up once.
+        self.counters['batches_received'] += 1
+        self.counters['frames_received'] += count
+        offset = 0
+        for i in xrange(count):
+            size, = _FRAME_HEADER.unpack_from(data, offset)
+            offset += _FRAME_HEADER.size
+            self._dispatch(data[offset:offset + size])
+            offset += size
+
+    def _dispatch(self, data):
+        try:
+            frame = json.loads(data, object_hook=self._object_hook)
+            getattr(self, '_op_' + frame['op'])(frame)
+        except Exception:
+            if actor.NOISY_ACTORS:
+                print "Dropping frame from another node:"
+                traceback.print_exc()
+
+    def _local_actor(self, actor_id):
+        target = actor.Actor.all_actors.get(actor_id)
+        if target is None or target.dead:
+            return None
+        return target
+
+    def _op_cast(self, frame):
+        target = self._local_actor(frame['to'])
+        if target is not None:
+            target._cast(frame['message'])
+            return
+        if not actor._match_call(frame['message']):
+            return
+        try:
+            raise actor.DeadActor(frame['to'])
+        except actor.DeadActor:
+            actor._respond(frame['message'], 'exception', exc.format_exc())
+
+    def _op_link(self, frame):
+        target = self._local_actor(frame['to'])
+        if target is not None:
+            target.add_link(frame['address'], trap_exit=frame['trap_exit'])
+            return
+        try:
+            raise actor.DeadActor(frame['to'])
+        except actor.DeadActor:
+            frame['address'].cast({
+                    'address': RemoteAddress(self, self.name, frame['to']),
+                    'exception': exc.format_exc()})
+
+    def _op_kill(self, frame):
+        target = self._local_actor(frame['to'])
+        if target is not None:
+            target.kill(actor.Killed, block=False)
+
+    def _op_wait(self, frame):
+        gevent.spawn(self._wait_for, frame)
+
+    def _wait_for(self, frame):
+        reply = {'op': 'result', 'ref': frame['ref']}
+        try:
+            target = self._local_actor(frame['to'])
+            if target is None:
+                raise actor.DeadActor(frame['to'])
+            reply['value'] = target._exit_event.get()
+        except Exception:
+            reply['exception'] = exc.format_exc()
+        self._send(frame['node'], reply)
+
+    def _op_result(self, frame):
+        future = self._waits.pop(frame['ref'], None)
+        if future is None:
+            return
+        if 'exception' in frame:
+            future.set_exception(actor.RemoteException(frame['exception']))
+        else:
+            future.set(frame['value'])
+
+    def _wait(self, node_name, actor_id):
+        ref = actor.unique_id()
+        future = self._waits[ref] = event.AsyncResult()
+        try:
+            self._send(node_name, {'op': 'wait', 'to': actor_id,
+                                   'ref': ref, 'node': self.name})
+            return future.get()
+        finally:
+            self._waits.pop(ref, None)
+
+
+def _remote_address(node_name, actor_id):
+    if node_name in _nodes:
+        return actor.Address.lookup(actor_id)
+    ## Any running node can carry messages to another node.
+    return RemoteAddress(_nodes.values()[0], node_name, actor_id)
+
+
+codec.register_extension(
+    RemoteAddress, 3,
+    lambda address: (address.node_name, address.actor_id),
+    lambda payload: actor.remote_address(*payload))
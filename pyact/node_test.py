@@ -0,0 +1,187 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import node
+
+
+class Echo(actor.Server):
+    def main(self, name):
+        self.rename(name)
+        super(Echo, self).main()
+
+    def echo(self, message):
+        return message
+
+
+def slow_echo(receive):
+    pat, msg = receive()
+    gevent.sleep(0.05)
+    return msg
+
+
+def crash(receive):
+    receive('crash')
+    raise RuntimeError('crashed')
+
+
+class TestNode(unittest.TestCase):
+    def setUp(self):
+        self.a = node.Node()
+        self.a.start()
+        self.b = node.Node()
+        self.b.start()
+
+    def tearDown(self):
+        self.a.stop()
+        self.b.stop()
+
+    def test_call(self):
+        a, b = self.a, self.b
+        echo = actor.spawn(Echo, 'test_call_echo')
+        def caller(receive):
+            remote = a.address(b.name, 'test_call_echo')
+            result = [remote.echo(i) for i in range(3)]
+            result.append(remote.echo({'address': remote}) ==
+                          {'address': remote})
+            return result
+
+        self.assertEquals(actor.spawn(caller).wait(), [0, 1, 2, True])
+        self.assertEquals(len(self.a._peers), 1)
+        echo.kill()
+
+    def test_link(self):
+        a, b = self.a, self.b
+        target = actor.spawn(crash)
+        def linker(receive):
+            remote = a.address(b.name, target.actor_id)
+            remote.link()
+            remote | 'crash'
+            pat, msg = receive({'address': object, 'exception': object})
+            return msg['address'] == remote
+
+        self.assertEquals(actor.spawn(linker).wait(), True)
+
+    def test_link_dead(self):
+        a, b = self.a, self.b
+        def linker(receive):
+            remote = a.address(b.name, 'no such actor')
+            remote.link()
+            pat, msg = receive({'address': object, 'exception': object})
+            return msg['address'] == remote
+
+        self.assertEquals(actor.spawn(linker).wait(), True)
+
+    def test_call_dead(self):
+        a, b = self.a, self.b
+        def caller(receive):
+            remote = a.address(b.name, 'no such actor')
+            try:
+                remote.echo(1, timeout=1)
+            except actor.RemoteException, e:
+                return 'DeadActor' in str(e)
+
+        self.assertEquals(actor.spawn(caller).wait(), True)
+
+    def test_wait(self):
+        a, b = self.a, self.b
+        target = actor.spawn(slow_echo)
+        def waiter(receive):
+            remote = a.address(b.name, target.actor_id)
+            remote | 'result'
+            return remote.wait()
+
+        self.assertEquals(actor.spawn(waiter).wait(), 'result')
+
+    def test_wait_exception(self):
+        a, b = self.a, self.b
+        target = actor.spawn(crash)
+        def waiter(receive):
+            remote = a.address(b.name, target.actor_id)
+            remote | 'crash'
+            try:
+                remote.wait()
+            except actor.RemoteException:
+                return True
+
+        self.assertEquals(actor.spawn(waiter).wait(), True)
+
+    def test_advertised_host(self):
+        self.assertRaises(ValueError, node.Node, '0.0.0.0')
+        wildcard = node.Node('0.0.0.0', advertised_host='127.0.0.1')
+        wildcard.start()
+        try:
+            def caller(receive):
+                echo = actor.spawn(Echo, 'test_advertised_echo')
+                remote = self.b.address(wildcard.name, 'test_advertised_echo')
+                try:
+                    return wildcard.name.split(':')[0], remote.echo(1)
+                finally:
+                    echo.kill()
+
+            self.assertEquals(actor.spawn(caller).wait(), ('127.0.0.1', 1))
+        finally:
+            wildcard.stop()
+
+    def cast_many(self, count):
+        a, b = self.a, self.b
+        def collector(receive, parent):
+            parent | [receive()[1] for i in range(count)]
+        def sender(receive):
+            target = actor.spawn(collector, gevent.getcurrent().address)
+            remote = a.address(b.name, target.actor_id)
+            for i in range(count):
+                remote | i
+            return receive()[1]
+
+        self.assertEquals(actor.spawn(sender).wait(), range(count))
+        return a.stats()
+
+    def test_batching(self):
+        stats = self.cast_many(100)
+        self.assertEquals(stats['frames_sent'], 100)
+        self.assertEquals(stats['batches_sent'], 1)
+        self.assertEquals(stats['flush_tick'], 1)
+        self.assertEquals(stats['batch_sizes'], {128: 1})
+        self.assertEquals(self.b.stats()['frames_received'], 100)
+
+    def test_flush_on_size(self):
+        self.a.max_batch_bytes = 1
+        stats = self.cast_many(10)
+        self.assertEquals(stats['batches_sent'], 10)
+        self.assertEquals(stats['flush_size'], 10)
+        self.assertEquals(stats['batch_sizes'], {1: 10})
+
+    def test_flush_on_timer(self):
+        self.a.flush_interval = 0.01
+        stats = self.cast_many(10)
+        self.assertEquals(stats['flush_timer'], 1)
+        self.assertFalse('flush_tick' in stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
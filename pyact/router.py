@@ -0,0 +1,209 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Routers spread messages over a pool of worker actors.
+
+    address = actor.spawn(router.Router, MyServer, 8,
+                          router.CONSISTENT_HASH)
+    address.call('lookup', 'some-key')
+
+The Address of the Router is used just like the Address of a single
+worker. Call messages are forwarded as they are, so the worker
+responds directly to the caller.
+"""
+
+import bisect
+import hashlib
+import struct
+
+from pyact import actor
+from pyact import shape
+from pyact import supervisor
+
+
+## Send each message to the next worker in turn.
+ROUND_ROBIN = 'round_robin'
+
+## Send all messages with the same key to the same worker.
+CONSISTENT_HASH = 'consistent_hash'
+
+## Send each message to the worker with the fewest queued messages.
+LEAST_LOADED = 'least_loaded'
+
+## Points on the hash ring per worker.
+REPLICAS = 100
+
+EXIT_PATTERN = {'address': actor.Address, 'exit': object}
+EXCEPTION_PATTERN = {'address': actor.Address, 'exception': object}
+
+## Sent by a Router to itself when it is time to respawn a worker;
+## router is the id of the Router, to tell it from routed messages.
+RESPAWN_PATTERN = {'respawn': int, 'router': str}
+
+_match_exit = shape.compile(EXIT_PATTERN)
+_match_exception = shape.compile(EXCEPTION_PATTERN)
+_match_respawn = shape.compile(RESPAWN_PATTERN)
+
+
+def _hash(key):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return struct.unpack('>I', hashlib.md5(key).digest()[:4])[0]
+
+
+def default_key(message):
+    """Return the routing key for message: the repr of the message of a
+    call, or of the whole message for anything else.
+    """
+    if actor._match_call(message):
+        message = message['message']
+    return repr(message)
+
+
+class Router(actor.Actor):
+    """An actor which spawns a pool of workers and forwards every
+    message it receives to one of them.
+
+    strategy is one of ROUND_ROBIN, CONSISTENT_HASH and LEAST_LOADED.
+    With CONSISTENT_HASH, key is called with each message and must
+    return a string. Workers which exit are replaced by a new worker
+    in the same position, so keys keep mapping to the same position.
+
+    Respawns are throttled like the restarts of a Supervisor, see
+    supervisor.RestartIntensity: messages for a worker which is
+    waiting to be respawned are held until it is, and after more than
+    max_restarts respawns within max_seconds the Router stops its
+    workers and exits with supervisor.TooManyRestarts.
+    """
+    def main(self, worker, size=4, strategy=ROUND_ROBIN, key=default_key,
+             max_restarts=10, max_seconds=5.0, backoff=0.01,
+             max_backoff=1.0):
+        route = getattr(self, '_route_' + strategy, None)
+        if route is None:
+            raise ValueError("unknown strategy: %r" % (strategy,))
+        self._worker = worker
+        self._workers = [actor.spawn_link(worker) for i in range(size)]
+        self._key = key
+        self._next = 0
+        self._replaced = set()
+        self._intensity = supervisor.RestartIntensity(
+            max_restarts, max_seconds, backoff, max_backoff)
+        ## Messages for the workers waiting to be respawned, by index.
+        self._held = {}
+        self._token = self.actor_id
+        self._ring = []
+        if strategy == CONSISTENT_HASH:
+            for index in range(size):
+                for replica in range(REPLICAS):
+                    self._ring.append(
+                        (_hash('%d-%d' % (index, replica)), index))
+            self._ring.sort()
+
+        try:
+            while True:
+                pattern, message = self.receive()
+                if self._worker_exited(message):
+                    continue
+                if _match_respawn(message) and \
+                        message['router'] == self._token:
+                    self._spawn_worker(message['respawn'])
+                    continue
+                self._forward(route(message), message)
+        finally:
+            for address in self._workers:
+                try:
+                    address.kill()
+                except actor.DeadActor:
+                    pass
+
+    def _forward(self, index, message):
+        if index in self._held:
+            self._held[index].append(message)
+            return
+        address = self._workers[index]
+        try:
+            address.cast(message)
+        except actor.DeadActor:
+            ## The worker exited, but the link message about it is
+            ## still in the mailbox.
+            self._replaced.add(address)
+            self._respawn(index)
+            self._forward(index, message)
+
+    def _respawn(self, index):
+        delay = self._intensity.restart()
+        if delay:
+            self._held[index] = []
+            actor.send_after(self.address, delay,
+                             {'respawn': index, 'router': self._token})
+        else:
+            self._workers[index] = actor.spawn_link(self._worker)
+
+    def _spawn_worker(self, index):
+        self._workers[index] = actor.spawn_link(self._worker)
+        for message in self._held.pop(index, []):
+            self._forward(index, message)
+
+    def _worker_exited(self, message):
+        ## A worker which raised sends an exception message and then an
+        ## exit message; one which returned only the exit message.
+        ## Respawn on the first, and swallow the rest.
+        exited = _match_exit(message)
+        if not (exited or _match_exception(message)):
+            return False
+        address = message['address']
+        if address in self._replaced:
+            if exited:
+                self._replaced.discard(address)
+            return True
+        try:
+            index = self._workers.index(address)
+        except ValueError:
+            return False
+        if not exited:
+            self._replaced.add(address)
+        self._respawn(index)
+        return True
+
+    def _route_round_robin(self, message):
+        index = self._next
+        self._next = (index + 1) % len(self._workers)
+        return index
+
+    def _route_consistent_hash(self, message):
+        point = _hash(self._key(message))
+        i = bisect.bisect(self._ring, (point, len(self._workers)))
+        return self._ring[i % len(self._ring)][1]
+
+    def _route_least_loaded(self, message):
+        best, best_load = 0, None
+        for index, address in enumerate(self._workers):
+            try:
+                load = len(address._actor._mailbox)
+            except actor.DeadActor:
+                continue
+            if best_load is None or load < best_load:
+                best, best_load = index, load
+                if not load:
+                    break
+        return best
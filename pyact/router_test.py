@@ -0,0 +1,153 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import router
+from pyact import supervisor
+
+
+class WhoAmI(actor.Server):
+    def whoami(self, message):
+        return self.actor_id
+
+    def crash(self, message):
+        raise RuntimeError(message)
+
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+
+
+class TestRouter(unittest.TestCase):
+    def call_all(self, strategy, messages, **kw):
+        class Client(actor.Actor):
+            def main(self):
+                address = actor.spawn(router.Router, WhoAmI, 3, strategy, **kw)
+                return [address.whoami(message) for message in messages]
+        return actor.spawn(Client).wait()
+
+    def test_round_robin(self):
+        ids = self.call_all(router.ROUND_ROBIN, range(6))
+        self.assertEquals(len(set(ids)), 3)
+        self.assertEquals(ids[:3], ids[3:])
+
+    def test_consistent_hash(self):
+        ids = self.call_all(router.CONSISTENT_HASH,
+                            ['a', 'b', 'a', 'c', 'b', 'a'] + range(20))
+        self.assertEquals(ids[0], ids[2])
+        self.assertEquals(ids[0], ids[5])
+        self.assertEquals(ids[1], ids[4])
+        self.assertEquals(len(set(ids)), 3)
+
+    def test_consistent_hash_key(self):
+        ids = self.call_all(router.CONSISTENT_HASH,
+                            [{'user': 'a', 'n': i} for i in range(5)],
+                            key=lambda message: message['message']['user'])
+        self.assertEquals(len(set(ids)), 1)
+
+    def test_least_loaded(self):
+        """Assert that calls avoid a worker with a backlog.
+        """
+        class Client(actor.Actor):
+            def main(self):
+                address = actor.spawn(router.Router, WhoAmI, 3,
+                                      router.LEAST_LOADED)
+                ## Wait for the Router to start its workers.
+                address.whoami()
+                busy = address._actor._workers[0]
+                futures = [busy.call_async('sleep', 0.05) for i in range(4)]
+                ## Let the busy worker take the first of them.
+                gevent.sleep()
+                ids = [address.whoami(i) for i in range(5)]
+                actor.wait_futures(futures)
+                return busy.actor_id, ids
+
+        busy_id, ids = actor.spawn(Client).wait()
+        self.assertEquals(len(ids), 5)
+        self.assertFalse(busy_id in ids)
+
+    def test_cast(self):
+        def worker(receive):
+            pat, msg = receive()
+            msg['reply'] | 'done'
+
+        class Client(actor.Actor):
+            def main(self):
+                address = actor.spawn(router.Router, worker, 2)
+                address | {'reply': self.address}
+                address | {'reply': self.address}
+                return self.receive()[1], self.receive()[1]
+
+        self.assertEquals(actor.spawn(Client).wait(), ('done', 'done'))
+
+    def test_crash_storm(self):
+        """Assert that workers which crash as they start are respawned
+        with a growing delay, until the Router gives up.
+        """
+        starts = []
+
+        def crasher(receive):
+            starts.append(time.time())
+            raise RuntimeError('crash')
+
+        address = actor.spawn(router.Router, crasher, 1, max_restarts=4)
+        self.assertRaises(supervisor.TooManyRestarts, address.wait)
+        self.assertEquals(len(starts), 5)
+        self.assert_(starts[-1] - starts[0] >= 0.01 + 0.02 + 0.04 + 0.08)
+
+    def test_respawn_once(self):
+        """Assert that a worker which raised is respawned once, and
+        that its link messages are not routed to the new worker.
+        """
+        starts = []
+
+        def worker(receive):
+            starts.append(1)
+            pat, msg = receive()
+            if msg == 'crash':
+                raise RuntimeError(msg)
+            msg['reply'] | 'done'
+
+        class Client(actor.Actor):
+            def main(self):
+                address = actor.spawn(router.Router, worker, 1, backoff=0)
+                address | 'crash'
+                ## Messages still in the mailbox of a worker which
+                ## raises are lost, so wait for the crash.
+                gevent.sleep(0.01)
+                address | {'reply': self.address}
+                return self.receive()[1], len(starts)
+
+        self.assertEquals(actor.spawn(Client).wait(), ('done', 2))
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError,
+                          actor.spawn(router.Router, WhoAmI, 1, 'x').wait)
+
+
+if __name__ == '__main__':
+    unittest.main()
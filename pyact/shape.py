@@ -45,11 +45,137 @@ class SizeMismatch(ShapeMismatch):
 
 
 def is_shaped(thing, shape):
+    return compile(shape)(thing)
+
+
+## Compiled matchers are cached on the structure of the shape, so
+## patterns that are rebuilt for every receive (dict literals and the
+## like) still share a single matcher. When the cache grows beyond
+## _MAXCACHE entries it is simply cleared, just like the re module.
+_MAXCACHE = 256
+_cache = {}
+
+
+def compile(shape):
+    """Compile shape into a matcher function.
+
+    The matcher takes a single argument and returns True if it is
+    shaped like shape, and False otherwise.  It does the same checks
+    as is_shaped_exc, but without building exceptions for mismatches
+    and without walking the shape for every match.
+
+    A matcher does not follow later changes to its shape; compile
+    the shape again after changing it. is_shaped always does.
+    """
     try:
-        is_shaped_exc(thing, shape)
-        return True
-    except ShapeMismatch:
-        return False
+        key = _shape_key(shape)
+        return _cache[key]
+    except TypeError:
+        ## Unhashable constants somewhere in the shape.
+        return _compile(shape)
+    except KeyError:
+        pass
+    matcher = _compile(shape)
+    if len(_cache) >= _MAXCACHE:
+        _cache.clear()
+    _cache[key] = matcher
+    return matcher
+
+
+def _normalize(shape):
+    if PY_MAJOR_VERSION==2:
+        # See is_shaped_exc for why str is matched as unicode.
+        if type(shape) == str:
+            return unicode(shape)
+        elif shape is str:
+            return unicode
+    return shape
+
+
+def _shape_key(shape):
+    shape = _normalize(shape)
+    shape_type = type(shape)
+    if shape_type is dict:
+        return (dict, frozenset(
+                [(name, _shape_key(subtype))
+                 for name, subtype in shape.items()]))
+    elif shape_type in (list, set):
+        for subtype in shape:
+            return (list, _shape_key(subtype))
+        return (list,)
+    elif shape_type is tuple:
+        return (tuple, tuple(map(_shape_key, shape)))
+    return (shape_type, shape)
+
+
+def _match_nothing(thing):
+    return False
+
+
+def _compile(shape):
+    shape = _normalize(shape)
+    shape_type = type(shape)
+
+    if shape_type is object:
+        return lambda thing: True
+    elif shape_type is dict:
+        items = [(name, _compile(subtype))
+                 for name, subtype in shape.items()]
+        def match_dict(thing):
+            if not isinstance(thing, dict):
+                return False
+            for name, match in items:
+                if name not in thing or not match(thing[name]):
+                    return False
+            return True
+        return match_dict
+    elif shape_type in (list, set):
+        match = _match_nothing
+        for subtype in shape:
+            match = _compile(subtype)
+            break
+        def match_sequence(thing):
+            if not isinstance(thing, (list, set)):
+                return False
+            for subitem in thing:
+                if not match(subitem):
+                    return False
+            return True
+        return match_sequence
+    elif shape_type is tuple:
+        matchers = tuple(map(_compile, shape))
+        size = len(matchers)
+        def match_tuple(thing):
+            if not isinstance(thing, tuple) or len(thing) != size:
+                return False
+            for subitem, match in zip(thing, matchers):
+                if not match(subitem):
+                    return False
+            return True
+        return match_tuple
+    elif isinstance(shape, type):
+        instance_of = shape
+        if PY_MAJOR_VERSION==2 and shape is unicode:
+            instance_of = basestring
+        def match_type(thing):
+            if type(thing) is shape_type:
+                ## thing is itself a type; only an exact match will do.
+                return thing == shape
+            return isinstance(thing, instance_of)
+        return match_type
+    elif PY_MAJOR_VERSION==2 and shape_type is unicode:
+        def match_text(thing):
+            if type(thing) is str:
+                try:
+                    thing = unicode(thing)
+                except UnicodeDecodeError:
+                    return False
+            return type(thing) is unicode and thing == shape
+        return match_text
+    else:
+        def match_value(thing):
+            return type(thing) is shape_type and thing == shape
+        return match_value
 
 
 def is_shaped_exc(thing, shape):
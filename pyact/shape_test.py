@@ -157,6 +157,56 @@ class TestShaped(unittest.TestCase):
             {'hello': 'world'}, {'hello': 'something'})
 
 
+class TestCompile(unittest.TestCase):
+    def test_compile(self):
+        match = shape.compile({'a': str, 'c': int})
+        self.assertEquals(match({'a': 'b', 'c': 5}), True)
+        self.assertEquals(match({'a': u'b', 'c': 5}), True)
+        self.assertEquals(match({'a': 'b'}), False)
+        self.assertEquals(match({'a': 'b', 'c': 'd'}), False)
+        self.assertEquals(match([1]), False)
+
+    def test_compile_nested(self):
+        match = shape.compile(
+            {'hello': int, 'world': [{'abc': str}], 'pos': (int, 'x')})
+        self.assertEquals(
+            match({'hello': 1, 'world': [{'abc': 'def'}], 'pos': (1, 'x')}),
+            True)
+        self.assertEquals(
+            match({'hello': 1, 'world': [{'abc': 1}], 'pos': (1, 'x')}),
+            False)
+        self.assertEquals(
+            match({'hello': 1, 'world': [], 'pos': (1, 'y')}),
+            False)
+
+    def test_compile_exact(self):
+        self.assertEquals(shape.compile(1)(1), True)
+        self.assertEquals(shape.compile(1)(True), False)
+        self.assertEquals(shape.compile(1)(1.0), False)
+        self.assertEquals(shape.compile('x')(u'x'), True)
+        self.assertEquals(shape.compile(int)(int), True)
+        self.assertEquals(shape.compile(object)(5), True)
+
+    def test_compile_cached(self):
+        self.assertTrue(
+            shape.compile({'call': str, 'message': object}) is
+            shape.compile({'call': str, 'message': object}))
+        self.assertFalse(
+            shape.compile({'call': str}) is shape.compile({'call': int}))
+        self.assertFalse(shape.compile(1) is shape.compile(True))
+
+    def test_changed_shape(self):
+        pattern = {'a': int}
+        self.assertEquals(shape.is_shaped({'a': 1}, pattern), True)
+        pattern['b'] = str
+        self.assertEquals(shape.is_shaped({'a': 1}, pattern), False)
+
+    def test_compile_unhashable(self):
+        match = shape.compile({'a': [int], 'b': bytearray('x')})
+        self.assertEquals(match({'a': [1], 'b': bytearray('x')}), True)
+        self.assertEquals(match({'a': [1], 'b': bytearray('y')}), False)
+
+
 class TestMakeShape(unittest.TestCase):
     mode = 'static'
     def test_simple(self):
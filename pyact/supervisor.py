@@ -0,0 +1,219 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Supervisors restart actors which exit.
+
+    address = actor.spawn(supervisor.Supervisor,
+                          [MyServer, supervisor.Child(worker, (42,))],
+                          supervisor.ONE_FOR_ALL)
+    address.children()
+
+A Supervisor starts its children with spawn_link, in order, and
+restarts them when it gets their exit or exception link messages,
+following its strategy:
+
+ * ONE_FOR_ONE: only the child which exited is restarted.
+ * ONE_FOR_ALL: all children are stopped and restarted.
+ * REST_FOR_ONE: the child which exited and the children started
+   after it are stopped and restarted.
+
+Children are stopped in the reverse of the order they were started
+in, and started again in order.
+
+If there are more than max_restarts restarts within max_seconds, the
+Supervisor stops all children and exits with TooManyRestarts, which
+its own links are told about. Restarts are also spaced out: the n-th
+restart within max_seconds waits backoff * 2 ** (n - 1) seconds, at
+most max_backoff, so a child which crashes as it starts does not keep
+the process busy respawning it.
+"""
+
+import collections
+import time
+
+from pyact import actor
+from pyact import shape
+
+
+ONE_FOR_ONE = 'one_for_one'
+ONE_FOR_ALL = 'one_for_all'
+REST_FOR_ONE = 'rest_for_one'
+
+## When a child is restarted: whenever it exits, only when it raises
+## an exception, or never.
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+TEMPORARY = 'temporary'
+
+EXIT_PATTERN = {'address': actor.Address, 'exit': object}
+EXCEPTION_PATTERN = {'address': actor.Address, 'exception': object}
+
+## Sent by a Supervisor to itself when it is time to restart the
+## children with these indexes.
+RESTART_PATTERN = {'restart': [int]}
+
+_match_exit = shape.compile(EXIT_PATTERN)
+_match_exception = shape.compile(EXCEPTION_PATTERN)
+_match_restart = shape.compile(RESTART_PATTERN)
+
+
+class TooManyRestarts(actor.ActorError):
+    """Raised by a Supervisor which had to restart its children more
+    often than it may.
+    """
+    pass
+
+
+class RestartIntensity(object):
+    """Counts restarts, and raises TooManyRestarts when there are more
+    than max_restarts within max_seconds. The n-th restart within
+    max_seconds waits backoff * 2 ** (n - 1) seconds, at most
+    max_backoff.
+    """
+    def __init__(self, max_restarts=3, max_seconds=5.0, backoff=0.01,
+                 max_backoff=1.0):
+        self.max_restarts = max_restarts
+        self.max_seconds = max_seconds
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._restarts = collections.deque()
+
+    def restart(self):
+        """Count a restart, and return how many seconds to wait before
+        doing it.
+        """
+        now = time.time()
+        restarts = self._restarts
+        restarts.append(now)
+        while restarts[0] < now - self.max_seconds:
+            restarts.popleft()
+        if len(restarts) > self.max_restarts:
+            raise TooManyRestarts(
+                "more than %d restarts in %s seconds" % (
+                    self.max_restarts, self.max_seconds))
+        return min(self.backoff * 2 ** (len(restarts) - 1),
+                   self.max_backoff)
+
+
+class Child(object):
+    """How a Supervisor starts a child: spawn_link(spawnable, *args,
+    **kw). restart is PERMANENT, TRANSIENT or TEMPORARY.
+    """
+    def __init__(self, spawnable, args=(), kw=None, restart=PERMANENT):
+        if restart not in (PERMANENT, TRANSIENT, TEMPORARY):
+            raise ValueError("unknown restart: %r" % (restart,))
+        self.spawnable = spawnable
+        self.args = args
+        self.kw = kw or {}
+        self.restart = restart
+
+
+class Supervisor(actor.Actor):
+    """An actor which starts children and restarts them when they
+    exit. children is a list of Child objects, or of spawnables which
+    are started with no arguments.
+
+    Calling children on the Supervisor returns the Addresses of its
+    children in order, with None for a child which is not running.
+    """
+    def main(self, children, strategy=ONE_FOR_ONE, max_restarts=3,
+             max_seconds=5.0, backoff=0.01, max_backoff=1.0):
+        if strategy not in (ONE_FOR_ONE, ONE_FOR_ALL, REST_FOR_ONE):
+            raise ValueError("unknown strategy: %r" % (strategy,))
+        self._specs = [child if isinstance(child, Child) else Child(child)
+                       for child in children]
+        self._children = [None] * len(self._specs)
+        self._strategy = strategy
+        self._intensity = RestartIntensity(max_restarts, max_seconds,
+                                           backoff, max_backoff)
+        try:
+            for index in range(len(self._specs)):
+                self._start_child(index)
+            while True:
+                pattern, message = self.receive()
+                if _match_exit(message):
+                    self._child_exited(message['address'], False)
+                elif _match_exception(message):
+                    self._child_exited(message['address'], True)
+                elif _match_restart(message):
+                    self._start_children(message['restart'])
+                elif actor._match_call(message):
+                    self._handle_call(message)
+        finally:
+            self._stop_children(range(len(self._children)))
+
+    def _handle_call(self, message):
+        if message['method'] == 'children':
+            self.respond(message, list(self._children))
+        else:
+            self.respond_invalid_method(message, message['method'])
+
+    def _child_exited(self, address, failed):
+        try:
+            index = self._children.index(address)
+        except ValueError:
+            ## A child which this Supervisor stopped.
+            return
+        self._children[index] = None
+        restart = self._specs[index].restart
+        if restart == TEMPORARY or (restart == TRANSIENT and not failed):
+            return
+        self._restart(index)
+
+    def _restart(self, index):
+        delay = self._intensity.restart()
+        if self._strategy == ONE_FOR_ONE:
+            indexes = [index]
+        elif self._strategy == ONE_FOR_ALL:
+            indexes = range(len(self._children))
+        else:
+            indexes = range(index, len(self._children))
+        self._stop_children(indexes)
+        if delay:
+            ## Wait without blocking, so that calls are still answered.
+            actor.send_after(self.address, delay, {'restart': indexes})
+        else:
+            self._start_children(indexes)
+
+    def _start_children(self, indexes):
+        for index in indexes:
+            if self._children[index] is None and \
+                    self._specs[index].restart != TEMPORARY:
+                self._start_child(index)
+
+    def _start_child(self, index):
+        spec = self._specs[index]
+        self._children[index] = actor.spawn_link(
+            spec.spawnable, *spec.args, **spec.kw)
+
+    def _stop_children(self, indexes):
+        for index in reversed(indexes):
+            address = self._children[index]
+            if address is None:
+                continue
+            self._children[index] = None
+            try:
+                ## Wait for the child to be gone before going on.
+                address._actor.kill(actor.Killed)
+            except actor.DeadActor:
+                pass
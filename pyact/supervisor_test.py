@@ -0,0 +1,133 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import supervisor
+
+
+def worker(receive):
+    pattern, message = receive()
+    if message == 'crash':
+        raise RuntimeError(message)
+    return message
+
+
+def crasher(receive, starts):
+    starts.append(time.time())
+    raise RuntimeError('crash')
+
+
+class TestSupervisor(unittest.TestCase):
+    def restarted(self, strategy, count, crash, **kw):
+        """Crash child number crash of a Supervisor with count workers
+        and return which children were restarted.
+        """
+        class Parent(actor.Actor):
+            def main(self):
+                sup = actor.spawn(supervisor.Supervisor, [worker] * count,
+                                  strategy, backoff=0, **kw)
+                before = sup.children()
+                before[crash] | 'crash'
+                gevent.sleep(0.01)
+                after = sup.children()
+                sup.kill()
+                return [old is not new for old, new in zip(before, after)]
+        return actor.spawn(Parent).wait()
+
+    def test_one_for_one(self):
+        self.assertEquals(self.restarted(supervisor.ONE_FOR_ONE, 3, 1),
+                          [False, True, False])
+
+    def test_one_for_all(self):
+        self.assertEquals(self.restarted(supervisor.ONE_FOR_ALL, 3, 1),
+                          [True, True, True])
+
+    def test_rest_for_one(self):
+        self.assertEquals(self.restarted(supervisor.REST_FOR_ONE, 3, 1),
+                          [False, True, True])
+
+    def test_restart_types(self):
+        children = [supervisor.Child(worker, restart=supervisor.TRANSIENT),
+                    supervisor.Child(worker, restart=supervisor.TRANSIENT),
+                    supervisor.Child(worker, restart=supervisor.TEMPORARY)]
+
+        class Parent(actor.Actor):
+            def main(self):
+                sup = actor.spawn(supervisor.Supervisor, children,
+                                  backoff=0)
+                for child, message in zip(sup.children(),
+                                          ['done', 'crash', 'crash']):
+                    child | message
+                gevent.sleep(0.01)
+                running = [child is not None for child in sup.children()]
+                sup.kill()
+                return running
+
+        self.assertEquals(actor.spawn(Parent).wait(), [False, True, False])
+
+    def test_too_many_restarts(self):
+        starts = []
+        address = actor.spawn(supervisor.Supervisor,
+                              [supervisor.Child(crasher, (starts,))],
+                              max_restarts=3, backoff=0)
+        self.assertRaises(supervisor.TooManyRestarts, address.wait)
+        self.assertEquals(len(starts), 4)
+
+    def test_backoff(self):
+        """Assert that the delay before a restart doubles each time.
+        """
+        starts = []
+        address = actor.spawn(supervisor.Supervisor,
+                              [supervisor.Child(crasher, (starts,))],
+                              max_restarts=4, backoff=0.01)
+        self.assertRaises(supervisor.TooManyRestarts, address.wait)
+        self.assertEquals(len(starts), 5)
+        gaps = [later - earlier
+                for earlier, later in zip(starts, starts[1:])]
+        for gap, delay in zip(gaps, [0.01, 0.02, 0.04, 0.08]):
+            self.assert_(gap >= delay, (gap, delay))
+
+    def test_stops_children(self):
+        class Parent(actor.Actor):
+            def main(self):
+                sup = actor.spawn(supervisor.Supervisor, [worker])
+                child, = sup.children()
+                ## Let the child start before the Supervisor is killed.
+                gevent.sleep(0.01)
+                sup.kill()
+                gevent.sleep(0.01)
+                try:
+                    child.wait()
+                except (actor.Killed, actor.DeadActor):
+                    return 'stopped'
+
+        self.assertEquals(actor.spawn(Parent).wait(), 'stopped')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,335 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""A timer wheel for many short timers.
+
+Every gevent timer is a node in the heap of the hub, so arming and
+cancelling one costs O(log n), and tens of thousands of actors
+waiting with receive timeouts make that heap a hotspot. Timers in
+this module live in a hierarchical timer wheel instead, where arming
+and cancelling are O(1) and a single gevent timer drives the wheel.
+That timer is armed for the next tick which has anything to do, so
+a process with a few distant timers does not wake up every tick.
+
+The price is resolution: deadlines are rounded up to the next TICK,
+so a timer never fires early but may fire up to a tick late.
+
+    t = timer.call_later(0.5, function, arg)
+    t.cancel()
+
+The wheel is the one in the Linux kernel: 256 slots one tick wide,
+then three levels of 64 slots, each slot as wide as the whole level
+below it. Timers far away sit in a coarse slot and are moved down,
+"cascaded", as their slot comes up.
+"""
+
+import math
+import time
+import traceback
+
+import gevent
+
+
+## Width of a slot in the first level of the wheel, in seconds.
+TICK = 0.01
+
+_ROOT_BITS = 8
+_LEVEL_BITS = 6
+_ROOT_MASK = (1 << _ROOT_BITS) - 1
+_LEVEL_MASK = (1 << _LEVEL_BITS) - 1
+
+## Timers less than this many ticks away go in the first level, the
+## second or the third; the rest in the last.
+_LEVEL_SPANS = (1 << _ROOT_BITS, 1 << (_ROOT_BITS + _LEVEL_BITS),
+                1 << (_ROOT_BITS + 2 * _LEVEL_BITS))
+
+## Timers further away than this many ticks are put in the last slot
+## and cascaded again when it comes up.
+_MAX_TICKS = (1 << (_ROOT_BITS + 3 * _LEVEL_BITS)) - 1
+
+
+class Timer(object):
+    """A function scheduled to be called by a TimerWheel.
+
+    active is True until the timer has fired, for timers which are
+    not repeated, or until it is cancelled.
+    """
+    __slots__ = ('expires', 'interval', 'function', 'args', '_seq',
+                 '_slot', '_wheel')
+
+    def __init__(self, wheel, expires, interval, function, args, seq):
+        self._wheel = wheel
+        self.expires = expires
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self._seq = seq
+        self._slot = None
+
+    active = property(lambda self: self._slot is not None)
+
+    def cancel(self):
+        """Stop the timer from firing. Does nothing if it is not
+        active.
+        """
+        slot = self._slot
+        if slot is not None:
+            slot.discard(self)
+            self._slot = None
+            self._wheel._count -= 1
+
+
+## The slot of an interval timer while its function runs.
+_FIRING = set()
+
+
+def _by_seq(timer):
+    return timer._seq
+
+
+class TimerWheel(object):
+    """A hierarchical timer wheel which is advanced by hand. The
+    functions of this module use one driven by a gevent timer.
+
+    Timer functions are called in the greenlet which calls advance,
+    in the order they were scheduled for each tick, and must not
+    block. An exception raised by a function is printed. An interval
+    timer whose function returns False is cancelled.
+    """
+    def __init__(self, now, tick=TICK):
+        self.tick = tick
+        ## The next tick to run; all ticks before it have run.
+        self._current = int(now / tick)
+        self._levels = [[None] * (1 << _ROOT_BITS)] + \
+            [[None] * (1 << _LEVEL_BITS) for i in xrange(3)]
+        self._count = 0
+        self._seq = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, now, delay, function, args=(), interval=None):
+        """Call function(*args) delay seconds after now, and then
+        every interval seconds if interval is given. Return the
+        Timer.
+        """
+        if not self._count:
+            ## Nothing is in the wheel, so it can skip ahead to now.
+            self._current = max(self._current, int(now / self.tick))
+        expires = int(math.ceil((now + delay) / self.tick))
+        if interval is not None:
+            interval = max(int(math.ceil(interval / self.tick)), 1)
+        self._seq += 1
+        timer = Timer(self, expires, interval, function, args, self._seq)
+        self._add(timer)
+        self._count += 1
+        return timer
+
+    def next_expiry(self):
+        """Return the time at which advance should next be called, or
+        None if the wheel is empty.
+        """
+        current = self._next_event()
+        if current is None:
+            return None
+        return current * self.tick
+
+    def advance(self, now):
+        """Run the ticks up to now, calling the functions of the
+        timers which expire. Return the number of timers fired.
+        """
+        target = int(now / self.tick)
+        fired = 0
+        while self._current <= target:
+            current = self._next_event()
+            if current is None or current > target:
+                self._current = target + 1
+                break
+            ## Skip the ticks in between, which have nothing to do.
+            self._current = current
+            index = current & _ROOT_MASK
+            if not index:
+                ## The first level has gone round; refill it from the
+                ## level above, and that one from the next if it has
+                ## gone round as well.
+                for level in (1, 2, 3):
+                    slot_index = (current >> (_ROOT_BITS + (level - 1) *
+                                              _LEVEL_BITS)) & _LEVEL_MASK
+                    self._cascade(level, slot_index)
+                    if slot_index:
+                        break
+            self._current = current + 1
+            slot = self._levels[0][index]
+            if slot is not None:
+                self._levels[0][index] = None
+                fired += self._fire(slot)
+        return fired
+
+    def _fire(self, slot):
+        fired = 0
+        for timer in sorted(slot, key=_by_seq):
+            ## Skip timers cancelled by an earlier function.
+            if timer._slot is not slot:
+                continue
+            fired += 1
+            if timer.interval is None:
+                timer._slot = None
+                self._count -= 1
+            else:
+                ## Still active, so that the function can cancel it.
+                timer._slot = _FIRING
+            try:
+                result = timer.function(*timer.args)
+            except:
+                traceback.print_exc()
+                result = None
+            if timer._slot is _FIRING:
+                if result is False:
+                    timer._slot = None
+                    self._count -= 1
+                else:
+                    timer.expires = max(timer.expires + timer.interval,
+                                        self._current)
+                    self._add(timer)
+        return fired
+
+    def _next_event(self):
+        """Return the first tick from the current one which has a slot
+        to fire or a slot to cascade, or None if the wheel is empty.
+        Ticks in between have nothing to do and can be skipped.
+        """
+        if not self._count:
+            return None
+        current = self._current
+        best = None
+        slots = self._levels[0]
+        for tick in xrange(current, current + (1 << _ROOT_BITS)):
+            if slots[tick & _ROOT_MASK] is not None:
+                best = tick
+                break
+        for level in (1, 2, 3):
+            ## The slots of a level are cascaded, in turn, on the
+            ## ticks where all the bits below the level are zero.
+            shift = _ROOT_BITS + (level - 1) * _LEVEL_BITS
+            slots = self._levels[level]
+            first = -(-current >> shift)
+            for index in xrange(first, first + (1 << _LEVEL_BITS)):
+                tick = index << shift
+                if best is not None and tick >= best:
+                    break
+                if slots[index & _LEVEL_MASK] is not None:
+                    best = tick
+                    break
+        return best
+
+    def _cascade(self, level, index):
+        slot = self._levels[level][index]
+        if slot is not None:
+            self._levels[level][index] = None
+            for timer in slot:
+                self._add(timer)
+
+    def _add(self, timer):
+        current = self._current
+        expires = timer.expires
+        if expires < current:
+            expires = current
+        delta = expires - current
+        if delta < _LEVEL_SPANS[0]:
+            slots = self._levels[0]
+            index = expires & _ROOT_MASK
+        elif delta < _LEVEL_SPANS[1]:
+            slots = self._levels[1]
+            index = (expires >> _ROOT_BITS) & _LEVEL_MASK
+        elif delta < _LEVEL_SPANS[2]:
+            slots = self._levels[2]
+            index = (expires >> (_ROOT_BITS + _LEVEL_BITS)) & _LEVEL_MASK
+        else:
+            if delta > _MAX_TICKS:
+                expires = current + _MAX_TICKS
+            slots = self._levels[3]
+            index = (expires >> (_ROOT_BITS + 2 * _LEVEL_BITS)) & _LEVEL_MASK
+        slot = slots[index]
+        if slot is None:
+            slot = slots[index] = set()
+        slot.add(timer)
+        timer._slot = slot
+
+
+## The wheel used by call_later and call_every, the one-shot gevent
+## timer which drives it while it has timers, and the tick that timer
+## is armed for. A new timer only needs the driver to be re-armed if
+## it expires before that tick: when the driver fires, advance handles
+## every tick up to now, cascades included.
+_wheel = TimerWheel(time.time())
+_driver = None
+_driver_tick = None
+
+
+def call_later(delay, function, *args):
+    """Call function(*args) in delay seconds. Return a Timer which
+    can be cancelled. function is called in the hub, like the
+    callback of a gevent timer; see TimerWheel for what it may do.
+    """
+    timer = _wheel.schedule(time.time(), delay, function, args)
+    if _driver is None or timer.expires < _driver_tick:
+        _arm()
+    return timer
+
+
+def call_every(interval, function, *args):
+    """Call function(*args) every interval seconds, until the Timer
+    which is returned is cancelled or function returns False.
+    """
+    timer = _wheel.schedule(time.time(), interval, function, args,
+                            interval)
+    if _driver is None or timer.expires < _driver_tick:
+        _arm()
+    return timer
+
+
+def pending():
+    """Return the number of active timers.
+    """
+    return len(_wheel)
+
+
+def _arm():
+    """Arm the driver for the next tick of the wheel which has
+    anything to do, or leave it stopped if the wheel is empty.
+    """
+    global _driver, _driver_tick
+    if _driver is not None:
+        _driver.stop()
+        _driver = None
+    expiry = _wheel.next_expiry()
+    if expiry is None:
+        return
+    _driver_tick = int(round(expiry / _wheel.tick))
+    _driver = gevent.get_hub().loop.timer(max(expiry - time.time(), 0))
+    _driver.start(_drive)
+
+
+def _drive():
+    _wheel.advance(time.time())
+    _arm()
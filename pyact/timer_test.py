@@ -0,0 +1,168 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import timer
+
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.fired = []
+        self.wheel = timer.TimerWheel(0.0, tick=1.0)
+
+    def schedule(self, delay, name, interval=None):
+        return self.wheel.schedule(0.0, delay, self.fired.append, (name,),
+                                   interval)
+
+    def test_order(self):
+        self.schedule(2, 'b')
+        self.schedule(1, 'a')
+        self.schedule(2, 'c')
+        self.assertEquals(self.wheel.advance(0.5), 0)
+        self.assertEquals(self.wheel.advance(2), 3)
+        self.assertEquals(self.fired, ['a', 'b', 'c'])
+        self.assertEquals(len(self.wheel), 0)
+
+    def test_cancel(self):
+        first = self.schedule(1, 'a')
+        second = self.schedule(1, 'b')
+        first.cancel()
+        first.cancel()
+        self.assertEquals((first.active, second.active), (False, True))
+        self.wheel.advance(1)
+        self.assertEquals(self.fired, ['b'])
+        self.assertEquals(second.active, False)
+
+    def test_interval(self):
+        repeated = self.schedule(1, 'tick', interval=2)
+        self.wheel.advance(5)
+        self.assertEquals(self.fired, ['tick'] * 3)
+        repeated.cancel()
+        self.wheel.advance(10)
+        self.assertEquals(len(self.fired), 3)
+
+    def test_interval_stops(self):
+        self.wheel.schedule(0.0, 1, lambda: False, interval=1)
+        self.assertEquals(self.wheel.advance(5), 1)
+        self.assertEquals(len(self.wheel), 0)
+
+    def test_cascade(self):
+        """Compare against a sorted list of deadlines, with timers
+        far enough away to be cascaded down from every level.
+        """
+        rand = random.Random(0)
+        delays = [rand.randrange(1, 1 << 21) for i in range(300)]
+        for delay in delays:
+            self.schedule(delay, delay)
+        now = 0
+        while len(self.wheel):
+            now += rand.randrange(1, 1 << 16)
+            self.wheel.advance(now)
+            expected = sorted([delay for delay in delays if delay <= now])
+            self.assertEquals(sorted(self.fired), expected)
+        self.assertEquals(sorted(self.fired), sorted(delays))
+
+    def test_never_early(self):
+        wheel = timer.TimerWheel(0.0, tick=0.01)
+        fired = []
+        wheel.schedule(0.005, 0.013, fired.append, (1,))
+        wheel.advance(0.0179)
+        self.assertEquals(fired, [])
+        wheel.advance(0.02)
+        self.assertEquals(fired, [1])
+
+    def test_next_expiry(self):
+        self.assertEquals(self.wheel.next_expiry(), None)
+        self.schedule(100, 'a')
+        self.schedule(3600, 'b')
+        self.assertEquals(self.wheel.next_expiry(), 100.0)
+        self.wheel.advance(100)
+        ## The next thing to do is to cascade the slot holding 'b'.
+        self.assertEquals(self.wheel.next_expiry(), 3584.0)
+        self.wheel.advance(3600)
+        self.assertEquals(self.fired, ['a', 'b'])
+        self.assertEquals(self.wheel.next_expiry(), None)
+
+
+class TestSendAfter(unittest.TestCase):
+    def test_send_after(self):
+        def waiter(receive):
+            actor.send_after(actor.curaddr(), 0.02, 'later')
+            cancelled = actor.send_after(actor.curaddr(), 0.01, 'never')
+            cancelled.cancel()
+            return receive(timeout=1)[1], receive(timeout=0.05)
+
+        self.assertEquals(actor.spawn(waiter).wait(), ('later', (None, None)))
+
+    def test_send_interval(self):
+        def ticker(receive):
+            repeated = actor.send_interval(actor.curaddr(), 0.01, 'tick')
+            for i in range(3):
+                receive('tick')
+            repeated.cancel()
+            return repeated.active
+
+        self.assertEquals(actor.spawn(ticker).wait(), False)
+
+    def test_receive_timeout(self):
+        """Assert that receive timeouts are wheel timers which are
+        cancelled once a message arrives.
+        """
+        def waiter(receive):
+            actor.send_after(actor.curaddr(), 0.01, 'hello')
+            message = receive('hello', timeout=1)[1]
+            return message, timer.pending(), receive(timeout=0.01)
+
+        self.assertEquals(actor.spawn(waiter).wait(),
+                          ('hello', 0, (None, None)))
+
+    def test_distant_timer_is_idle(self):
+        """Assert that a timer far away does not wake the hub every
+        tick until it fires.
+        """
+        advanced = []
+        advance = timer._wheel.advance
+        timer._wheel.advance = lambda now: advanced.append(advance(now))
+        try:
+            distant = timer.call_later(3600, lambda: None)
+            gevent.sleep(0.05)
+            distant.cancel()
+        finally:
+            del timer._wheel.advance
+        self.assertEquals(advanced, [])
+
+    def test_interval_to_dead_actor(self):
+        address = actor.spawn(lambda receive: None)
+        address.wait()
+        repeated = actor.send_interval(address, 0.01, 'tick')
+        gevent.sleep(0.05)
+        self.assertEquals(repeated.active, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Trace files of actor events.
+
+Write every event of pyact.actor.set_tracer to a compact binary file:
+
+    trace.start('actors.trace')
+    ...
+    trace.stop()
+
+and find the slowest hops between actors with:
+
+    python -m pyact.trace actors.trace
+
+A trace file starts with MAGIC, followed by records. Each record
+starts with a byte which tells its kind. Kind 0 gives a name to an
+index, so that actor ids are only written once:
+
+    >BIH  0, index, length of the name, followed by the name (UTF-8)
+
+All other records are events:
+
+    >BdIIQ  kind, timestamp, actor index, peer index, value
+
+where index 0 stands for None.
+"""
+
+import collections
+import struct
+import sys
+
+from pyact import actor
+
+
+MAGIC = 'PYACTTR1'
+
+KINDS = ['spawn', 'send', 'deliver', 'match', 'timeout', 'exit', 'drop']
+
+_CODES = dict([(kind, code + 1) for code, kind in enumerate(KINDS)])
+_NAME = struct.Struct('>BIH')
+_EVENT = struct.Struct('>BdIIQ')
+
+Event = collections.namedtuple(
+    'Event', 'kind timestamp actor_id peer_id value')
+
+
+class FileTracer(object):
+    """A tracer which writes events to a trace file.
+    """
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._names = {}
+
+    def __call__(self, kind, timestamp, actor_id, peer_id, value):
+        self._file.write(_EVENT.pack(
+                _CODES[kind], timestamp, self._index(actor_id),
+                self._index(peer_id), value))
+
+    def close(self):
+        self._file.close()
+
+    def _index(self, name):
+        if name is None:
+            return 0
+        index = self._names.get(name)
+        if index is None:
+            index = self._names[name] = len(self._names) + 1
+            if isinstance(name, unicode):
+                data = name.encode('utf-8')
+            else:
+                data = str(name)
+            self._file.write(_NAME.pack(0, index, len(data)) + data)
+        return index
+
+
+_file_tracer = None
+
+
+def start(path):
+    """Start writing all events to the trace file at path.
+    """
+    global _file_tracer
+    stop()
+    _file_tracer = FileTracer(path)
+    actor.set_tracer(_file_tracer)
+
+
+def stop():
+    """Stop writing events started with start, and close the file.
+    """
+    global _file_tracer
+    if _file_tracer is not None:
+        actor.set_tracer(None)
+        _file_tracer.close()
+        _file_tracer = None
+
+
+def read(path):
+    """Yield the events in the trace file at path as Event tuples.
+    """
+    f = open(path, 'rb')
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a trace file" % (path,))
+        names = {0: None}
+        while True:
+            code = f.read(1)
+            if not code:
+                break
+            if code == '\x00':
+                code, index, length = _NAME.unpack(
+                    code + f.read(_NAME.size - 1))
+                names[index] = f.read(length).decode('utf-8')
+                continue
+            code, timestamp, actor_index, peer_index, value = _EVENT.unpack(
+                code + f.read(_EVENT.size - 1))
+            yield Event(KINDS[code - 1], timestamp, names[actor_index],
+                        names[peer_index], value)
+    finally:
+        f.close()
+
+
+def latencies(events):
+    """Return a (sender, receiver, latency) tuple for each message that
+    was matched by its receiver, in the order they were matched.
+    latency is the time from the cast to the match, in seconds.
+
+    A cast is paired with the next delivery or drop from the same
+    sender to the same receiver. Messages from other nodes have no
+    cast event, so their latency is counted from delivery.
+    """
+    sends = collections.defaultdict(collections.deque)
+    delivered = {}
+    result = []
+    for event in events:
+        if event.kind == 'send':
+            sends[event.actor_id, event.peer_id].append(event.timestamp)
+        elif event.kind == 'drop':
+            pending = sends.get((event.peer_id, event.actor_id))
+            if pending:
+                pending.popleft()
+        elif event.kind == 'deliver':
+            pending = sends.get((event.peer_id, event.actor_id))
+            sent = pending.popleft() if pending else event.timestamp
+            delivered[event.actor_id, event.value] = event.peer_id, sent
+        elif event.kind == 'match' and event.value:
+            sender, sent = delivered.pop((event.actor_id, event.value),
+                                         (None, None))
+            if sent is not None:
+                result.append((sender, event.actor_id,
+                               event.timestamp - sent))
+    return result
+
+
+def hops(events):
+    """Return (sender, receiver, count, mean, maximum) for each pair
+    of actors which exchanged messages, slowest maximum first.
+    """
+    stats = {}
+    for sender, receiver, latency in latencies(events):
+        count, total, maximum = stats.get((sender, receiver), (0, 0.0, 0.0))
+        stats[sender, receiver] = (
+            count + 1, total + latency, max(maximum, latency))
+    result = [(pair[0], pair[1], hop_count, hop_total / hop_count, hop_max)
+              for pair, (hop_count, hop_total, hop_max)
+              in stats.iteritems()]
+    result.sort(key=lambda hop: hop[4], reverse=True)
+    return result
+
+
+def main(argv):
+    for sender, receiver, count, mean, maximum in hops(read(argv[1]))[:20]:
+        print "%-24s -> %-24s %8d %10.1f %10.1f usec" % (
+            sender, receiver, count, mean * 1e6, maximum * 1e6)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,128 @@
+# Copyright (c) 2013 Johan Rydberg
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import tempfile
+import unittest
+
+import gevent
+
+from pyact import actor
+from pyact import trace
+
+
+def echo(receive):
+    pat, msg = receive()
+    msg['reply'] | 'pong'
+    receive('never', timeout=0.01)
+
+
+class Pinger(actor.Actor):
+    def main(self):
+        address = actor.spawn_link(echo)
+        echo_id = address.actor_id
+        address | {'reply': self.address}
+        self.receive('pong')
+        self.receive({'exit': object, 'address': object})
+        return echo_id
+
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self):
+        actor.set_tracer(None)
+        trace.stop()
+
+    def test_hooks(self):
+        events = []
+        actor.set_tracer(lambda *event: events.append(trace.Event(*event)))
+        pinger = actor.spawn(Pinger)
+        echo_id = pinger.wait()
+        self.assertEquals(actor.set_tracer(None) is not None, True)
+        pinger_id = events[0].actor_id
+
+        kinds = [(event.kind, event.actor_id, event.peer_id, event.value)
+                 for event in events if echo_id in (event.actor_id,
+                                                    event.peer_id)]
+        self.assertEquals(kinds, [
+                ('spawn', echo_id, pinger_id, 1),
+                ('send', pinger_id, echo_id, 0),
+                ('deliver', echo_id, pinger_id, 1),
+                ('match', echo_id, None, 1),
+                ('send', echo_id, pinger_id, 0),
+                ('deliver', pinger_id, echo_id, 1),
+                ('timeout', echo_id, None, 0),
+                ('send', echo_id, pinger_id, 0),
+                ('deliver', pinger_id, echo_id, 2),
+                ('exit', echo_id, None, 0)])
+
+    def test_drop(self):
+        """Assert that a dropped message is not paired with the next
+        delivery.
+        """
+        def collect(receive):
+            return [receive()[1] for i in range(3)]
+
+        def sender(receive):
+            sink = actor.spawn(collect, mailbox_size=2,
+                               mailbox_policy='drop_newest')
+            for message in ['a', 'b', 'c']:
+                sink | message
+            gevent.sleep(0.1)
+            sink | 'd'
+            return sink.wait()
+
+        events = []
+        actor.set_tracer(lambda *event: events.append(trace.Event(*event)))
+        self.assertEquals(actor.spawn(sender).wait(), ['a', 'b', 'd'])
+        self.assertEquals(
+            [event.kind for event in events].count('drop'), 1)
+        latencies = [hop[2] for hop in trace.latencies(events)]
+        self.assertEquals(len(latencies), 3)
+        self.assertTrue(latencies[-1] < 0.05)
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            trace.start(path)
+            echo_id = actor.spawn(Pinger).wait()
+            trace.stop()
+            events = list(trace.read(path))
+        finally:
+            os.unlink(path)
+        self.assertEquals(events[0].kind, 'spawn')
+        pinger_id = events[0].actor_id
+        self.assertEquals(events[-1], trace.Event(
+                'exit', events[-1].timestamp, pinger_id, None, 0))
+        hops = trace.hops(events)
+        self.assertEquals(sorted([(sender, receiver, count)
+                                  for sender, receiver, count, mean, maximum
+                                  in hops]),
+                          sorted([(pinger_id, echo_id, 1),
+                                  (echo_id, pinger_id, 2)]))
+        for hop in hops:
+            self.assertTrue(0 <= hop[3] <= hop[4])
+
+
+if __name__ == '__main__':
+    unittest.main()